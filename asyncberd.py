@@ -0,0 +1,497 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncore
+import collections
+import json
+import mimetools
+import socket
+import sys
+import time
+import urllib
+import urllib2
+import urlparse
+from StringIO import StringIO
+
+import berd
+from transport import Transport
+
+
+class AsyncResult(object):
+    """The eventual result of an asynchronous call
+
+    Callbacks fire from inside the event loop (AsyncTwitter.run) once the
+    request has finished
+    """
+
+    def __init__(self):
+        self.done = False
+        self.value = None
+        self.error = None
+        self._callbacks = []
+
+    def add_callback(self, callback, errback=None):
+        """Calls callback(value) on success or errback(error) on failure.
+        If the result is already in, the call happens right away
+        """
+        if self.done:
+            self._fire(callback, errback)
+        else:
+            self._callbacks.append((callback, errback))
+        return self
+
+    def get(self):
+        """Returns the value, or raises the error the request failed with
+        """
+        if not self.done:
+            raise RuntimeError('AsyncResult is not finished yet, run the event loop first')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _fire(self, callback, errback):
+        if self.error is None:
+            if callback is not None:
+                callback(self.value)
+        elif errback is not None:
+            errback(self.error)
+
+    def _set(self, value, error=None):
+        self.done = True
+        self.value = value
+        self.error = error
+        callbacks, self._callbacks = self._callbacks, []
+        for callback, errback in callbacks:
+            self._fire(callback, errback)
+
+    def _then(self, wrap):
+        """Returns a new AsyncResult holding wrap(value)
+        """
+        result = AsyncResult()
+
+        def callback(value):
+            try:
+                wrapped = wrap(value)
+            except Exception, e:
+                result._set(None, e)
+            else:
+                result._set(wrapped)
+
+        def errback(error):
+            result._set(None, error)
+
+        self.add_callback(callback, errback)
+        return result
+
+
+class _HTTPRequest(asyncore.dispatcher):
+    """One non-blocking HTTP/1.0 GET. The server closes the connection when
+    it's done, so the body is everything up to EOF
+    """
+
+    def __init__(self, client, url, headers, result):
+        asyncore.dispatcher.__init__(self, map=client._map)
+        self._client = client
+        self._url = url
+        self._result = result
+        self._in = []
+        self.deadline = None
+
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        lines = ['GET %s HTTP/1.0' % path, 'Host: %s' % parts.netloc]
+        for name, value in headers.iteritems():
+            lines.append('%s: %s' % (name, value))
+        self._out = '\r\n'.join(lines) + '\r\n\r\n'
+
+        if client.timeout is not None:
+            self.deadline = time.time() + client.timeout
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.connect(client._resolve(parts.hostname, parts.port or 80))
+        except Exception:
+            self.close()
+            raise
+
+    def handle_connect(self):
+        pass
+
+    def writable(self):
+        return self.connecting or bool(self._out)
+
+    def handle_write(self):
+        sent = self.send(self._out)
+        self._out = self._out[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self._in.append(data)
+
+    def handle_close(self):
+        self.close()
+        try:
+            value = self._parse(''.join(self._in))
+        except Exception, e:
+            self._client._finish(self, None, e)
+        else:
+            self._client._finish(self, value)
+
+    def handle_error(self):
+        error = sys.exc_info()[1]
+        self.close()
+        self._client._finish(self, None, error)
+
+    def fail(self, error):
+        self.close()
+        self._client._finish(self, None, error)
+
+    def _parse(self, raw):
+        head, sep, body = raw.partition('\r\n\r\n')
+        if not sep:
+            raise IOError('Incomplete response from %s' % self._url)
+        status_line, sep, header_lines = head.partition('\r\n')
+        parts = status_line.split(' ', 2)
+        code = int(parts[1])
+        reason = len(parts) > 2 and parts[2] or ''
+        headers = mimetools.Message(StringIO(header_lines))
+        if code >= 400:
+            raise urllib2.HTTPError(self._url, code, reason, headers, StringIO(body))
+        return json.loads(body)
+
+
+class AsyncClient(object):
+    """Runs many HTTP requests at once over one asyncore event loop
+
+    At most max_concurrency sockets are open at a time; anything past that
+    waits in a queue until a slot frees up
+    """
+
+    def __init__(self, max_concurrency=256, timeout=60):
+        """
+
+        Arguments:
+        - `max_concurrency`: Most requests in flight at a time
+        - `timeout`: Seconds before a request is failed with socket.timeout (None for no limit)
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._map = {}
+        self._pending = collections.deque()
+        self._active = set()
+        self._addresses = {}
+
+    def _resolve(self, host, port):
+        """Caches DNS lookups, which would otherwise block the loop on every request
+        """
+        key = (host, port)
+        try:
+            return self._addresses[key]
+        except KeyError:
+            address = (socket.gethostbyname(host), port)
+            self._addresses[key] = address
+            return address
+
+    def fetch(self, url, headers=None):
+        """Queues a GET for url and returns an AsyncResult holding the decoded JSON
+        """
+        result = AsyncResult()
+        self._pending.append((url, headers or {}, result))
+        self._start_pending()
+        return result
+
+    def _start_pending(self):
+        while self._pending and len(self._active) < self.max_concurrency:
+            url, headers, result = self._pending.popleft()
+            try:
+                request = _HTTPRequest(self, url, headers, result)
+            except Exception, e:
+                result._set(None, e)
+            else:
+                self._active.add(request)
+
+    def _finish(self, request, value, error=None):
+        if request not in self._active:
+            return
+        self._active.discard(request)
+        self._start_pending()
+        request._result._set(value, error)
+
+    def _expire(self):
+        now = time.time()
+        for request in list(self._active):
+            if request.deadline is not None and request.deadline < now:
+                request.fail(socket.timeout('Timed out fetching %s' % request._url))
+
+    def pending(self):
+        """Returns the number of requests queued or in flight
+        """
+        return len(self._pending) + len(self._active)
+
+    def run(self, timeout=None):
+        """Runs the event loop until every request (including ones queued by
+        callbacks) has finished, or until timeout seconds have passed
+        """
+        if timeout is not None:
+            stop = time.time() + timeout
+        while self.pending():
+            asyncore.loop(timeout=1, use_poll=True, map=self._map, count=1)
+            self._expire()
+            if timeout is not None and time.time() > stop:
+                break
+
+
+def _each(model):
+    """Returns a function that turns a list of dicts into a list of model objects
+    """
+    def wrap(data):
+        return [model(x) for x in data]
+    return wrap
+
+
+class AsyncPaginated(object):
+    """Async counterpart of a Paginated object
+
+    Keeps its since_id and page state in the wrapped Paginated, so it
+    behaves the same way, but every call returns an AsyncResult holding a
+    list of Status (or DirectMessage) objects
+    """
+
+    def __init__(self, paginated, twitter):
+        """
+
+        Arguments:
+        - `paginated`: berd.Paginated (or subclass) to take the URL and state from
+        - `twitter`: AsyncTwitter that owns the event loop
+        """
+        self._paginated = paginated
+        self._twitter = twitter
+
+    def set_count(self, count):
+        return self._paginated.set_count(count)
+
+    def get_count(self):
+        return self._paginated.get_count()
+
+    def _fetch(self, input_data, update=None):
+        url = "?".join((self._paginated._url, urllib.urlencode(input_data)))
+        paginated = self._paginated
+
+        def wrap(data):
+            if update is not None:
+                data = update(data)
+            return list(paginated.to_status(data))
+
+        return self._twitter._fetch(url)._then(wrap)
+
+    def get_tweets(self):
+        """ Async get_tweets. Ignores since_id
+        """
+        self._paginated._page = 1
+        return self._fetch({'count': self._paginated._count},
+                           self._paginated._update_last_id)
+
+    def next_tweets(self):
+        """ Async next_tweets. Every tweet since the last call
+        """
+        self._paginated._page = 1
+        return self._fetch(self._paginated._next_tweets_input(),
+                           self._paginated._update_last_id)
+
+    def retrieve_page(self, page):
+        """ Async retrieve_page
+        """
+        return self._fetch(self._paginated._page_input(page))
+
+    def next_page(self):
+        """ Async next_page
+        """
+        self._paginated._page = self._paginated._page + 1
+        return self.retrieve_page(self._paginated._page)
+
+
+class AsyncTwitter(object):
+    """Non-blocking version of berd.Twitter
+
+    Methods have the same names and arguments as on Twitter, but return an
+    AsyncResult right away. Call run() to drive the event loop; results hold
+    the same Status, User and DirectMessage objects Twitter returns (lists
+    instead of generators)
+    """
+
+    def __init__(self, uname='', pword='', base_url=berd._base_url,
+                 max_concurrency=256, timeout=60, client=None):
+        """Credentials aren't checked up front. Use verify_credentials for that
+
+        Arguments:
+        - `uname`: Username
+        - `pword`: Password
+        - `base_url`: Root of the API, defaults to http://twitter.com/
+        - `max_concurrency`: Most requests in flight at once
+        - `timeout`: Per request timeout in seconds
+        - `client`: AsyncClient to share with other AsyncTwitter objects, so one
+                    loop and one concurrency limit covers all of them
+        """
+        self._transport = Transport(base_url)
+        if uname:
+            self._transport.set_basic_auth(uname, pword)
+            self._uname = uname
+        if client is None:
+            client = AsyncClient(max_concurrency, timeout)
+        self._client = client
+
+    def run(self, timeout=None):
+        """Runs the event loop until everything queued has finished
+        """
+        self._client.run(timeout)
+
+    def _fetch(self, url):
+        return self._client.fetch(url, self._transport.request_headers('GET', url))
+
+    def _call(self, method, input_data=None, wrap=None):
+        url = self._transport.base_url + method + '.json'
+        if input_data is not None:
+            url = "?".join((url, urllib.urlencode(input_data)))
+        result = self._fetch(url)
+        if wrap is None:
+            return result
+        return result._then(wrap)
+
+    def _paginated(self, paginated):
+        return AsyncPaginated(paginated, self)
+
+    def verify_credentials(self):
+        """AsyncResult holding a User for the authenticated account
+        """
+        return self._call('account/verify_credentials', None, berd.get_user)
+
+    def friends_timeline(self):
+        return self._paginated(berd.Paginated('statuses/friends_timeline', self._transport))
+
+    def public_timeline(self):
+        return self._paginated(berd.Paginated('statuses/public_timeline', self._transport))
+
+    def user_timeline(self, user_id=None):
+        if user_id == None:
+            return self._paginated(berd.Paginated('statuses/user_timeline', self._transport))
+        return self._paginated(berd.UTimelinePaginated(self._transport, user_id))
+
+    def mentions(self):
+        return self._paginated(berd.Paginated('statuses/mentions', self._transport))
+
+    def direct_messages(self):
+        return self._paginated(berd.DirectMessagePaginated('direct_messages', self._transport))
+
+    def sent_direct_messages(self):
+        return self._paginated(berd.DirectMessagePaginated('direct_messages/sent', self._transport))
+
+    def set_status(self, status, in_reply_to_status_id=None):
+        input_data = {'status': status}
+        if in_reply_to_status_id != None:
+            input_data['in_reply_to_status_id'] = in_reply_to_status_id
+        return self._call('statuses/update', input_data, berd.Status)
+
+    def get_status(self, status_id):
+        return self._call('statuses/show/%s' % status_id, None, berd.Status)
+
+    def destroy_status(self, status_id):
+        return self._call('statuses/destroy/%s' % status_id, None, berd.Status)
+
+    def new_direct_message(self, user, text):
+        return self._call('direct_messages/new', {'user': user, 'text': text},
+                          berd.DirectMessage)
+
+    def destroy_direct_message(self, id):
+        return self._call('direct_messages/destroy/%s' % id, None, berd.DirectMessage)
+
+    def friendship_create(self, id, follow=True):
+        return self._call('friendships/create/%s' % id, {'follow': follow}, berd.get_user)
+
+    def friendship_destroy(self, id):
+        return self._call('friendships/destroy/%s' % id, None, berd.get_user)
+
+    def friendship_show_by_id(self, target_user_id, source_user_id=None):
+        input_data = {'target_id': target_user_id}
+        if source_user_id != None:
+            input_data['source_id'] = source_user_id
+        return self._call('friendships/show', input_data)
+
+    def friendship_show_by_screenname(self, target_screenname, source_screenname=None):
+        input_data = {'target_screen_name': target_screenname}
+        if source_screenname != None:
+            input_data['source_screen_name'] = source_screenname
+        return self._call('friendships/show', input_data)
+
+    def friends_ids(self):
+        return self._call('friends/ids')
+
+    def followers_ids(self):
+        return self._call('followers/ids')
+
+    def favorites(self, page=1, screenname=None):
+        if screenname == None:
+            method = 'favorites'
+        else:
+            method = 'favorites/%s' % screenname
+        return self._call(method, {'page': page}, _each(berd.Status))
+
+    def favorite_create(self, id):
+        return self._call('favorites/create/%s' % id, None, berd.Status)
+
+    def favorite_destroy(self, id):
+        return self._call('favorites/destroy/%s' % id, None, berd.Status)
+
+    def notifications_follow(self, id):
+        return self._call('notifications/follow/%s' % id, None, berd.get_user)
+
+    def notifications_leave(self, id):
+        return self._call('notifications/leave/%s' % id, None, berd.get_user)
+
+    def block_create(self, id):
+        return self._call('blocks/create/%s' % id, None, berd.get_user)
+
+    def block_destroy(self, id):
+        return self._call('blocks/destroy/%s' % id, None, berd.get_user)
+
+    def block_exists(self, id):
+        """AsyncResult holding a User, or False if there's no block (404)
+        """
+        result = AsyncResult()
+
+        def callback(data):
+            result._set(berd.get_user(data))
+
+        def errback(error):
+            if isinstance(error, urllib2.HTTPError) and error.getcode() == 404:
+                result._set(False)
+            else:
+                result._set(None, error)
+
+        self._call('blocks/exists/%s' % id).add_callback(callback, errback)
+        return result
+
+    def block_list(self, page=1):
+        return self._call('blocks/blocking', {'page': page}, _each(berd.get_user))
+
+    def block_ids(self):
+        return self._call('blocks/blocking/ids')
+
+    def rate_limit_status(self):
+        return self._call('account/rate_limit_status')
@@ -0,0 +1,252 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+
+# Write methods that undo each other. Operations on the same target from
+# these pairs are coalesced before anything is sent
+OPPOSITES = {
+    'favorite_create': 'favorite_destroy',
+    'favorite_destroy': 'favorite_create',
+    'friendship_create': 'friendship_destroy',
+    'friendship_destroy': 'friendship_create',
+    'block_create': 'block_destroy',
+    'block_destroy': 'block_create',
+    'notifications_follow': 'notifications_leave',
+    'notifications_leave': 'notifications_follow',
+}
+
+# The halves of OPPOSITES that make something. Only a create followed by
+# its destroy cancels out; a destroy followed by its create still has to
+# leave the thing created
+CREATES = set(['favorite_create', 'friendship_create', 'block_create',
+               'notifications_follow'])
+
+# Write methods where doing it twice is the same as doing it once
+IDEMPOTENT = set(OPPOSITES) | set(['destroy_status', 'destroy_direct_message'])
+
+# Result states
+DONE = 'done'
+FAILED = 'failed'
+COALESCED = 'coalesced'
+
+
+def is_transient(error):
+    """True for errors worth retrying: 5xx responses and network trouble
+    """
+    if isinstance(error, urllib2.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (urllib2.URLError, httplib.HTTPException, socket.error))
+
+
+class BatchResult(object):
+    """What happened to one operation in a batch
+
+    state is DONE (value holds what the Twitter method returned), FAILED
+    (error holds the exception) or COALESCED. A coalesced operation was
+    either a repeat, merged into the operation at index merged_into and
+    sharing its value or error, or (merged_into is None) never sent because
+    it was cancelled out by its opposite on the same target, or was a
+    destroy made pointless by the create after it
+    """
+    __slots__ = ('operation', 'state', 'value', 'error', 'attempts', 'merged_into')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.state = None
+        self.value = None
+        self.error = None
+        self.attempts = 0
+        self.merged_into = None
+
+    @property
+    def ok(self):
+        # A repeat shares the error of the operation it was merged into
+        return self.state != FAILED and self.error is None
+
+    def __repr__(self):
+        return 'BatchResult(%r, %s)' % (self.operation, self.state)
+
+
+class BatchExecutor(object):
+    """Runs a list of write operations against a Twitter object, several at
+    a time
+
+    An operation is a tuple of a Twitter method name and its arguments, ie
+    ('favorite_create', 1234) or ('destroy_status', 5678). Before anything
+    is sent, operations on the same target are coalesced: repeats of an
+    idempotent operation run once, and a create followed by its destroy
+    (favorite, friendship, block, notifications) cancel out and neither is
+    sent. A destroy followed by its create only sends the create, which
+    leaves the same thing behind. Operations on different targets run in
+    no particular order
+
+    Requests go out workers at a time with PRIORITY_WRITE, so with
+    Twitter.enable_rate_limiting they wait for quota instead of failing.
+    5xx responses and network errors are retried with exponential backoff.
+    The Twitter's ConnectionPool allows max_per_host connections, so more
+    workers than that needs a Twitter made with a bigger pool
+    """
+
+    def __init__(self, twitter, workers=4, retries=3, backoff=1.0, max_backoff=60):
+        """
+
+        Arguments:
+        - `twitter`: berd.Twitter object to run the operations with
+        - `workers`: Requests in flight at once
+        - `retries`: Times a transient failure is retried
+        - `backoff`: Seconds before the first retry, doubled for each one after
+        - `max_backoff`: Most seconds to wait before a retry
+        """
+        self.twitter = twitter
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.stats = {'sent': 0, 'retries': 0, 'coalesced': 0, 'failed': 0}
+
+    def coalesce(self, operations):
+        """Returns (results, to_run): a BatchResult for every operation, and
+        the indexes of the operations that still need to be sent
+        """
+        results = [BatchResult(x) for x in operations]
+        # target -> indexes of the operations on it still standing, all the
+        # same method since opposites cancel as they're found
+        pending = {}
+        # Targets whose standing create replaced a destroy before it
+        replaced = set()
+        order = []
+        for index, operation in enumerate(operations):
+            method = operation[0]
+            if method not in IDEMPOTENT or len(operation) != 2:
+                order.append(index)
+                continue
+            family = min(method, OPPOSITES.get(method, method))
+            target = (family, str(operation[1]))
+            standing = pending.get(target)
+            if not standing:
+                pending[target] = [index]
+                order.append(index)
+            elif operations[standing[0]][0] == method:
+                standing.append(index)
+            elif method in CREATES:
+                # Whatever was destroyed gets made again, so only the
+                # create needs sending
+                for x in standing:
+                    results[x].state = COALESCED
+                pending[target] = [index]
+                replaced.add(target)
+                order.append(index)
+            elif target in replaced:
+                # Destroy, create, destroy: the creates cancel out but a
+                # destroy still has to go
+                for x in standing:
+                    results[x].state = COALESCED
+                pending[target] = [index]
+                replaced.discard(target)
+                order.append(index)
+            else:
+                # This undoes everything standing on the target
+                for x in standing + [index]:
+                    results[x].state = COALESCED
+                pending[target] = []
+
+        for standing in pending.values():
+            # Repeats share the result of the first
+            for x in standing[1:]:
+                results[x].state = COALESCED
+                results[x].merged_into = standing[0]
+        order = [x for x in order if results[x].state == None]
+        self.stats['coalesced'] += len(operations) - len(order)
+        return results, order
+
+    def _run_one(self, result):
+        method = getattr(self.twitter, result.operation[0])
+        args = result.operation[1:]
+        while True:
+            result.attempts += 1
+            try:
+                result.value = method(*args)
+            except Exception, e:
+                if result.attempts > self.retries or not is_transient(e):
+                    result.state = FAILED
+                    result.error = e
+                    return
+                delay = min(self.backoff * 2 ** (result.attempts - 1), self.max_backoff)
+                # Jittered, so a burst of failures doesn't retry in lockstep
+                time.sleep(delay * (0.5 + random.random() / 2))
+                self._count('retries')
+            else:
+                result.state = DONE
+                return
+
+    def _count(self, name):
+        self._lock.acquire()
+        try:
+            self.stats[name] += 1
+        finally:
+            self._lock.release()
+
+    def run(self, operations):
+        """Runs operations and returns a list of BatchResults in the same order
+
+        Arguments:
+        - `operations`: List of (method name, arg, ...) tuples
+        """
+        operations = [tuple(x) for x in operations]
+        for operation in operations:
+            if not hasattr(self.twitter, operation[0]):
+                raise ValueError('Twitter has no method %r' % operation[0])
+        results, order = self.coalesce(operations)
+        queue = list(reversed(order))
+
+        def work():
+            while True:
+                self._lock.acquire()
+                try:
+                    if not queue:
+                        return
+                    index = queue.pop()
+                    self.stats['sent'] += 1
+                finally:
+                    self._lock.release()
+                self._run_one(results[index])
+                if results[index].state == FAILED:
+                    self._count('failed')
+
+        threads = [threading.Thread(target=work)
+                   for x in range(min(self.workers, len(queue)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Repeats get the outcome of the operation they were merged into
+        for result in results:
+            if result.state == COALESCED and result.merged_into != None:
+                first = results[result.merged_into]
+                if first.state != COALESCED:
+                    result.value = first.value
+                    result.error = first.error
+        return results
@@ -0,0 +1,162 @@
+"""
+    End to end benchmark of berd against fakeserver.FakeTwitter
+
+    Runs each scenario for a number of iterations and reports calls/sec,
+    p50/p99 latency per call and allocations per call. Allocations are
+    measured with tracemalloc when it's importable (peak KB traced per call),
+    otherwise as the net number of gc tracked objects a call leaves behind
+
+    Usage: python benchmarks/endpoints.py [options]
+"""
+
+import gc
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import berd
+import instrument
+from fakeserver import FakeTwitter
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def percentile(samples, pct):
+    """pct'th percentile of an already sorted list
+    """
+    if not samples:
+        return 0.0
+    index = int(round(pct / 100.0 * (len(samples) - 1)))
+    return samples[index]
+
+
+def scenarios(twitter, count=20):
+    """(name, callable) pairs. Each callable makes one API call and consumes
+    everything it returns, the way a caller would
+    """
+    timeline = twitter.friends_timeline()
+    pages = twitter.friends_timeline()
+    timeline.set_count(count)
+    pages.set_count(count)
+
+    def next_tweets():
+        # Start over each time, otherwise since_id means there's nothing new
+        timeline._last_id = None
+        return len(list(timeline.next_tweets()))
+
+    def next_page():
+        if pages._page >= 50:
+            pages._page = 0
+        return len(list(pages.next_page()))
+
+    def favorites():
+        return len(list(twitter.favorites()))
+
+    def block_list():
+        return len(list(twitter.block_list()))
+
+    return [('next_tweets', next_tweets), ('next_page', next_page),
+            ('favorites', favorites), ('block_list', block_list)]
+
+
+def measure(func, iterations, warmup=5):
+    """Returns a dict of timings and allocations for iterations calls of func
+    """
+    for x in range(warmup):
+        func()
+
+    latencies = []
+    started = time.time()
+    for x in range(iterations):
+        start = time.time()
+        func()
+        latencies.append(time.time() - start)
+    elapsed = time.time() - started
+    latencies.sort()
+
+    # Allocations are measured on a separate pass so the tracing doesn't
+    # skew the timings
+    allocation_runs = min(iterations, 50)
+    gc.collect()
+    if tracemalloc != None:
+        peak = 0
+        for x in range(allocation_runs):
+            # Restarting clears the traces, so each call's peak is its own
+            tracemalloc.start()
+            func()
+            peak += tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        allocations = peak / 1024.0 / allocation_runs
+    else:
+        before = len(gc.get_objects())
+        for x in range(allocation_runs):
+            func()
+        gc.collect()
+        allocations = float(len(gc.get_objects()) - before) / allocation_runs
+
+    return {'calls': iterations, 'seconds': elapsed,
+            'per_sec': iterations / elapsed,
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'allocations': allocations}
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--iterations', type='int', default=200,
+                      help='calls per scenario')
+    parser.add_option('-l', '--latency', type='float', default=0.0,
+                      help='server latency per request, in seconds')
+    parser.add_option('-s', '--text-size', type='int', default=60,
+                      help='characters per status text')
+    parser.add_option('-c', '--count', type='int', default=20,
+                      help='statuses per timeline page')
+    parser.add_option('-i', '--instrument', action='store_true', default=False,
+                      help='turn on instrumentation and print where the time went')
+    parser.add_option('-o', '--only', action='append', default=[],
+                      help='run just this scenario (repeatable)')
+    options, args = parser.parse_args()
+
+    fake = FakeTwitter(latency=options.latency, text_size=options.text_size)
+    base_url = fake.start()
+    twitter = berd.Twitter('bench', 'bench', base_url=base_url)
+    if options.instrument:
+        twitter.set_instrumentation()
+
+    if tracemalloc != None:
+        unit = 'KB peak'
+    else:
+        unit = 'objs left'
+    print '%-12s %8s %10s %10s %10s %10s' % ('scenario', 'calls', 'calls/s',
+                                             'p50 ms', 'p99 ms', unit + '/call')
+    for name, func in scenarios(twitter, options.count):
+        if options.only and name not in options.only:
+            continue
+        result = measure(func, options.iterations)
+        print '%-12s %8d %10.1f %10.2f %10.2f %10.1f' % (
+            name, result['calls'], result['per_sec'], result['p50'],
+            result['p99'], result['allocations'])
+
+    stats = fake.stats()
+    print
+    print 'server: %d requests, %d bytes' % (stats['requests'], stats['bytes'])
+    print 'pool:', twitter.pool_stats()
+
+    snapshot = twitter.instrumentation_snapshot()
+    if snapshot != None:
+        print
+        print '%-30s' % 'p50 us' + ''.join(['%10s' % x for x in ('total',) + instrument.PHASES])
+        for name, endpoint in sorted(snapshot['endpoints'].items()):
+            row = [endpoint['latency']] + [endpoint['phases'][x] for x in instrument.PHASES]
+            print '%-30s' % name + ''.join(['%10d' % x.get('p50', 0) for x in row])
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
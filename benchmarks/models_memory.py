@@ -0,0 +1,131 @@
+"""
+    Compares the memory held by Status objects before and after they were
+    moved to __slots__ and stopped keeping a second copy of the raw dict
+
+    Usage: python benchmarks/models_memory.py [count]
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import berd
+
+
+def sample_status(i):
+    """A status shaped like a real statuses/friends_timeline entry
+    """
+    return {
+        'id': 5000000000 + i, 'text': u'Status number %d, it\u2019s a tweet' % i,
+        'created_at': 'Sat Oct 17 20:15:00 +0000 2009', 'source': 'web',
+        'favorited': False, 'truncated': False, 'in_reply_to_status_id': None,
+        'in_reply_to_screen_name': None, 'in_reply_to_user_id': None,
+        'geo': None, 'coordinates': None, 'place': None, 'contributors': None,
+        'user': {
+            'id': 1000 + i % 50, 'name': 'User %d' % (i % 50),
+            'screen_name': 'user%d' % (i % 50), 'url': 'http://example.com/',
+            'profile_image_url': 'http://a1.twimg.com/profile_images/%d/a.png' % i,
+            'description': u'Just a user\u2019s description', 'location': 'Earth',
+            'followers_count': 120, 'friends_count': 80, 'statuses_count': 3000 + i,
+            'created_at': 'Mon Jan 05 10:00:00 +0000 2009', 'protected': False,
+            'utc_offset': -18000, 'time_zone': 'Eastern Time (US & Canada)',
+            'profile_background_color': '9ae4e8', 'profile_text_color': '000000',
+            'profile_link_color': '0000ff', 'profile_sidebar_fill_color': 'e0ff92',
+            'profile_sidebar_border_color': '87bc44', 'favourites_count': 3,
+            'notifications': False, 'following': False, 'verified': False,
+            'geo_enabled': False, 'profile_background_tile': False,
+            'profile_background_image_url': 'http://s.twimg.com/images/bg.png',
+        },
+    }
+
+
+class LegacyUser:
+    """berd.User as it was: an old-style class holding the raw dict plus copies
+    """
+
+    def __init__(self, user_dict):
+        self.user_dict = user_dict
+        self.id = user_dict['id']
+        self.name = user_dict['name']
+        self.screen_name = user_dict['screen_name']
+        self.url = user_dict['url']
+        self.profile_image_url = user_dict['profile_image_url']
+        self.description = user_dict['description'].replace(u'\u2019', u'\u0027')
+        self.location = user_dict['location'].replace(u'\u2019', u'\u0027')
+        self.followers_count = user_dict['followers_count']
+        self.friend_count = user_dict['friends_count']
+        self.statuses_count = user_dict['statuses_count']
+        self.created_at = user_dict['created_at']
+        self.protected = user_dict['protected']
+        self.utc_offset = user_dict['utc_offset']
+
+
+class LegacyStatus:
+    """berd.Status as it was
+    """
+
+    def __init__(self, status_dict):
+        self.status_dict = status_dict
+        self.favorited = status_dict['favorited']
+        self.truncated = status_dict['truncated']
+        self.text = status_dict['text'].replace(u'\u2019', u'\u0027')
+        self.text = self.text.replace(u'\u201c', u'\u0027')
+        self.created_at = status_dict['created_at']
+        self.source = status_dict['source']
+        self.in_reply_to_status_id = status_dict['in_reply_to_status_id']
+        self.in_reply_to_screen_name = status_dict['in_reply_to_screen_name']
+        self.id = status_dict['id']
+        self.in_reply_to_user_id = status_dict['in_reply_to_user_id']
+        self.user = LegacyUser(status_dict['user'])
+
+
+def deep_size(root):
+    """Bytes reachable from root, counting every object once
+    """
+    seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, type)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for klass in type(obj).__mro__:
+                for name in getattr(klass, '__slots__', ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return total
+
+
+def measure(model, count):
+    # Decode fresh for every model so nothing is shared between runs
+    raw = json.dumps([sample_status(i) for i in range(count)])
+    statuses = [model(x) for x in json.loads(raw)]
+    return deep_size(statuses)
+
+
+def main():
+    count = 10000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    old = measure(LegacyStatus, count)
+    new = measure(berd.Status, count)
+    print '%d statuses' % count
+    print 'old: %10d bytes  %6d per status' % (old, old / count)
+    print 'new: %10d bytes  %6d per status' % (new, new / count)
+    print 'new/old: %.2f' % (float(new) / old)
+
+
+if __name__ == '__main__':
+    main()
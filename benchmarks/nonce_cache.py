@@ -0,0 +1,93 @@
+"""
+    Nonce checks per second, and nonces held, for a replay cache under
+    sustained load: the dict of expiry times purged every window that
+    MemoryOAuthDataStore used to keep, against NonceCache with and without
+    its Bloom filter front. The worst single call shows the pause the purge
+    puts on whichever request triggers it
+
+    Time is simulated, so a short window stands in for the five minute
+    timestamp_threshold and the run covers many windows
+
+    Usage: python benchmarks/nonce_cache.py [rate] [seconds] [window]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import oauth
+
+
+class LegacyNonces(object):
+    """(consumer key, token key, nonce) -> expiry, rebuilt every window
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.nonces = {}
+        self._next_purge = window
+
+    def use(self, consumer_key, token_key, nonce, now):
+        if now >= self._next_purge:
+            self.nonces = dict([(k, v) for k, v in self.nonces.iteritems() if v > now])
+            self._next_purge = now + self.window
+        key = (consumer_key, token_key, nonce)
+        if key in self.nonces:
+            return True
+        self.nonces[key] = now + self.window
+        return False
+
+    def __len__(self):
+        return len(self.nonces)
+
+
+def run(cache, rate, seconds, tokens):
+    held = 0
+    replays = 0
+    stall = 0.0
+    total = rate * seconds
+    start = time.time()
+    for i in xrange(total):
+        now = float(i) / rate
+        token = tokens[i % len(tokens)]
+        before = time.time()
+        if cache.use('gateway', token, str(i), now):
+            replays += 1
+        stall = max(stall, time.time() - before)
+        # Replay a nonce from a few seconds back now and then
+        if i % 100 == 0 and i > rate:
+            if not cache.use('gateway', tokens[(i - rate) % len(tokens)], str(i - rate), now):
+                raise AssertionError('missed a replay')
+        if i % rate == 0:
+            held = max(held, len(cache))
+    elapsed = time.time() - start
+    assert replays == 0
+    return total / elapsed, held, stall
+
+
+def main():
+    rate = 20000
+    seconds = 60
+    window = 10
+    if len(sys.argv) > 1:
+        rate = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        seconds = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        window = int(sys.argv[3])
+    tokens = ['token-%d' % i for i in range(2000)]
+
+    print '%d checks/sec for %d simulated seconds, %ds window' % (rate, seconds, window)
+    print '%-24s %12s %14s %14s' % ('', 'checks/sec', 'most held', 'worst call ms')
+    for name, cache in (('dict + purge', LegacyNonces(window)),
+                        ('buckets', oauth.NonceCache(window)),
+                        ('buckets + bloom', oauth.NonceCache(window, bloom_bits=1 << 23))):
+        per_sec, held, stall = run(cache, rate, seconds, tokens)
+        print '%-24s %12.0f %14d %14.1f' % (name, per_sec, held, stall * 1000)
+    print '(three windows of traffic is %d nonces)' % (3 * rate * window)
+
+
+if __name__ == '__main__':
+    main()
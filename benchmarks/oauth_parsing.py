@@ -0,0 +1,110 @@
+"""
+    OAuthRequest.from_request calls per second, before and after the
+    Authorization header and query strings were parsed by single pass
+    tokenizers instead of comma splitting and cgi.parse_qs followed by a
+    second unquote
+
+    Requests look like a gateway's: an OAuth header with a realm, a few
+    query string parameters, and a url with a query of its own
+
+    Usage: python benchmarks/oauth_parsing.py [requests]
+"""
+
+import cgi
+import os
+import sys
+import time
+import urllib
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import oauth
+
+
+def legacy_split_header(header):
+    params = {}
+    parts = header.split(',')
+    for param in parts:
+        if param.find('realm') > -1:
+            continue
+        param = param.strip()
+        param_parts = param.split('=', 1)
+        params[param_parts[0]] = urllib.unquote(param_parts[1].strip('\"'))
+    return params
+
+
+def legacy_split_url_string(param_str):
+    parameters = cgi.parse_qs(param_str, keep_blank_values=False)
+    for k, v in parameters.iteritems():
+        parameters[k] = urllib.unquote(v[0])
+    return parameters
+
+
+def legacy_from_request(http_method, http_url, headers=None, parameters=None,
+        query_string=None):
+    """OAuthRequest.from_request as it was
+    """
+    if parameters is None:
+        parameters = {}
+    if headers and 'Authorization' in headers:
+        auth_header = headers['Authorization']
+        if auth_header[:6] == 'OAuth ':
+            auth_header = auth_header[6:]
+            try:
+                parameters.update(legacy_split_header(auth_header))
+            except:
+                raise oauth.OAuthError('Unable to parse OAuth parameters from '
+                    'Authorization header.')
+    if query_string:
+        parameters.update(legacy_split_url_string(query_string))
+    param_str = urlparse.urlparse(http_url)[4]
+    parameters.update(legacy_split_url_string(param_str))
+    if parameters:
+        return oauth.OAuthRequest(http_method, http_url, parameters)
+    return None
+
+
+def make_requests(count):
+    consumer = oauth.OAuthConsumer('gateway-consumer', 'gateway secret')
+    token = oauth.OAuthToken('token-key', 'token secret')
+    method = oauth.OAuthSignatureMethod_HMAC_SHA1()
+    requests = []
+    for i in range(count):
+        url = 'http://gateway.example.com/statuses/user_timeline.json'
+        request = oauth.OAuthRequest.from_consumer_and_token(consumer, token,
+            'GET', url, {'count': '200', 'since_id': str(5000000000 + i),
+                         'screen_name': 'berd_user_%d' % (i % 100)})
+        request.sign_request(method, consumer, token)
+        headers = request.to_header('http://gateway.example.com/')
+        query = 'count=200&since_id=%d' % (5000000000 + i)
+        requests.append((url + '?screen_name=berd_user_%d' % (i % 100), headers, query))
+    return requests
+
+
+def run(from_request, requests):
+    start = time.time()
+    for url, headers, query in requests:
+        from_request('GET', url, headers, None, query)
+    return len(requests) / (time.time() - start)
+
+
+def main():
+    count = 50000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    requests = make_requests(count)
+    for url, headers, query in requests[:100]:
+        assert (legacy_from_request('GET', url, headers, None, query).parameters ==
+                oauth.OAuthRequest.from_request('GET', url, headers, None, query).parameters)
+
+    print '%d requests' % count
+    before = run(legacy_from_request, requests)
+    after = run(oauth.OAuthRequest.from_request, requests)
+    print '%-24s %12.0f' % ('before from_request/sec', before)
+    print '%-24s %12.0f  (%.2fx)' % ('after from_request/sec', after, after / before)
+    print '%-24s %12.1f %12.1f' % ('us/request', 1e6 / before, 1e6 / after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+    Signatures per second for OAuthSignatureMethod_HMAC_SHA1, before and
+    after it kept a signing context (escaped key plus a pre-keyed HMAC) per
+    consumer/token pair and parameter normalization stopped re-escaping the
+    static oauth_* parameters on every request
+
+    Requests are signed round robin across many accounts, the way a poller
+    driving a few thousand accounts signs them
+
+    Usage: python benchmarks/oauth_signing.py [accounts] [requests]
+"""
+
+import binascii
+import hmac
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import oauth
+
+
+def legacy_normalized_parameters(oauth_request):
+    """OAuthRequest.get_normalized_parameters as it was, minus deleting
+    oauth_signature from the request
+    """
+    params = dict(oauth_request.parameters)
+    params.pop('oauth_signature', None)
+    key_values = [(oauth.escape(oauth._utf8_str(k)), oauth.escape(oauth._utf8_str(v)))
+                  for k, v in params.items()]
+    key_values.sort()
+    return '&'.join(['%s=%s' % (k, v) for k, v in key_values])
+
+
+class LegacyHMAC_SHA1(oauth.OAuthSignatureMethod):
+    """OAuthSignatureMethod_HMAC_SHA1 as it was
+    """
+
+    def get_name(self):
+        return 'HMAC-SHA1'
+
+    def build_signature_base_string(self, oauth_request, consumer, token):
+        sig = (
+            oauth.escape(oauth_request.get_normalized_http_method()),
+            oauth.escape(oauth_request.get_normalized_http_url()),
+            oauth.escape(legacy_normalized_parameters(oauth_request)),
+        )
+
+        key = '%s&' % oauth.escape(consumer.secret)
+        if token:
+            key += oauth.escape(token.secret)
+        raw = '&'.join(sig)
+        return key, raw
+
+    def build_signature(self, oauth_request, consumer, token):
+        key, raw = self.build_signature_base_string(oauth_request, consumer,
+            token)
+        try:
+            import hashlib
+            hashed = hmac.new(key, raw, hashlib.sha1)
+        except:
+            import sha
+            hashed = hmac.new(key, raw, sha)
+        return binascii.b2a_base64(hashed.digest())[:-1]
+
+
+def make_workload(accounts, requests):
+    consumer = oauth.OAuthConsumer('berd-consumer-key', 'berd consumer/secret+value')
+    tokens = [oauth.OAuthToken('%d-tokenkey' % i, 'token secret/%d+=' % i)
+              for i in range(accounts)]
+    work = []
+    for i in range(requests):
+        token = tokens[i % accounts]
+        request = oauth.OAuthRequest.from_consumer_and_token(
+            consumer, token, 'GET', 'http://twitter.com/statuses/friends_timeline.json',
+            {'count': 200, 'since_id': 5000000000 + i})
+        request.set_parameter('oauth_signature_method', 'HMAC-SHA1')
+        work.append((request, token))
+    return consumer, work
+
+
+def run(method, consumer, work):
+    start = time.time()
+    for request, token in work:
+        method.build_signature(request, consumer, token)
+    return len(work) / (time.time() - start)
+
+
+def run_normalize(normalize, work):
+    start = time.time()
+    for request, token in work:
+        normalize(request)
+    return len(work) / (time.time() - start)
+
+
+def count_quotes(method, consumer, work):
+    # urllib.quote calls per signature
+    calls = [0]
+    real_quote = oauth.urllib.quote
+
+    def quote(*args, **kwargs):
+        calls[0] += 1
+        return real_quote(*args, **kwargs)
+    oauth.urllib.quote = quote
+    try:
+        for request, token in work:
+            method.build_signature(request, consumer, token)
+    finally:
+        oauth.urllib.quote = real_quote
+    return float(calls[0]) / len(work)
+
+
+def run_hmac_only(method, consumer, work):
+    # Just the keying and hashing, with the base strings built beforehand
+    raws = [(method.build_signature_base_string(r, consumer, t)[1], t) for r, t in work]
+    if isinstance(method, LegacyHMAC_SHA1):
+        import hashlib
+        start = time.time()
+        for raw, token in raws:
+            key = '%s&%s' % (oauth.escape(consumer.secret), oauth.escape(token.secret))
+            binascii.b2a_base64(hmac.new(key, raw, hashlib.sha1).digest())[:-1]
+    else:
+        start = time.time()
+        for raw, token in raws:
+            method.get_context(consumer, token).sign(raw)
+    return len(raws) / (time.time() - start)
+
+
+def main():
+    accounts = 2000
+    requests = 50000
+    if len(sys.argv) > 1:
+        accounts = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        requests = int(sys.argv[2])
+    consumer, work = make_workload(accounts, requests)
+
+    legacy = LegacyHMAC_SHA1()
+    current = oauth.OAuthSignatureMethod_HMAC_SHA1()
+    # Warm the context cache, as a long running poller would have
+    run(current, consumer, work[:accounts])
+
+    for request, token in work[:100]:
+        assert (legacy.build_signature(request, consumer, token) ==
+                current.build_signature(request, consumer, token))
+        assert legacy_normalized_parameters(request) == request.get_normalized_parameters()
+
+    print '%d accounts, %d requests' % (accounts, requests)
+    print '%-24s %14s %14s' % ('', 'before', 'after')
+    before, after = run(legacy, consumer, work), run(current, consumer, work)
+    print '%-24s %14.0f %14.0f  (%.2fx)' % ('signatures/sec', before, after, after / before)
+    before = run_normalize(legacy_normalized_parameters, work)
+    after = run_normalize(lambda r: r.get_normalized_parameters(), work)
+    print '%-24s %14.0f %14.0f  (%.2fx)' % ('normalizations/sec', before, after, after / before)
+    before, after = count_quotes(legacy, consumer, work[:1000]), count_quotes(current, consumer, work[:1000])
+    print '%-24s %14.1f %14.1f' % ('quote calls/signature', before, after)
+    before, after = run_hmac_only(legacy, consumer, work), run_hmac_only(current, consumer, work)
+    print '%-24s %14.0f %14.0f  (%.2fx)' % ('hmac only/sec', before, after, after / before)
+
+
+if __name__ == '__main__':
+    main()
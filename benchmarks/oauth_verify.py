@@ -0,0 +1,126 @@
+"""
+    Verifications per second for OAuthServer.verify_request, before and
+    after MemoryOAuthDataStore and its combined consumer/token/nonce lookup
+
+    "before" is the server as it was (separate lookups, and the signature
+    built a second time after it checked out) over a plain dict data store.
+    "signature only" is just building the signatures, the floor the
+    gateway can get to
+
+    Usage: python benchmarks/oauth_verify.py [tokens] [requests]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import oauth
+
+
+class DictDataStore(oauth.OAuthDataStore):
+    """The simplest data store someone would write against the abstract one
+    """
+
+    def __init__(self, consumers, tokens):
+        self.consumers = consumers
+        self.tokens = tokens
+        self.nonces = set()
+
+    def lookup_consumer(self, key):
+        return self.consumers.get(key)
+
+    def lookup_token(self, token_type, token_token):
+        return self.tokens.get(token_token)
+
+    def lookup_nonce(self, consumer, token, nonce):
+        key = (consumer.key, token.key, nonce)
+        if key in self.nonces:
+            return nonce
+        self.nonces.add(key)
+        return None
+
+
+class LegacyOAuthServer(oauth.OAuthServer):
+    """verify_request as it was
+    """
+
+    def verify_request(self, oauth_request):
+        version = self._get_version(oauth_request)
+        consumer = self._get_consumer(oauth_request)
+        token = self._get_token(oauth_request, 'access')
+        self._check_signature(oauth_request, consumer, token)
+        parameters = oauth_request.get_nonoauth_parameters()
+        return consumer, token, parameters
+
+    def _check_signature(self, oauth_request, consumer, token):
+        oauth.OAuthServer._check_signature(self, oauth_request, consumer, token)
+        signature_method = self._get_signature_method(oauth_request)
+        signature_method.build_signature(oauth_request, consumer, token)
+
+
+def make_requests(consumer, tokens, count):
+    method = oauth.OAuthSignatureMethod_HMAC_SHA1()
+    requests = []
+    for i in range(count):
+        token = tokens[i % len(tokens)]
+        request = oauth.OAuthRequest.from_consumer_and_token(
+            consumer, token, 'GET', 'http://gateway.example.com/statuses/home_timeline.json',
+            {'count': 200, 'since_id': 5000000000 + i})
+        request.set_parameter('oauth_nonce', '%d-%s' % (i, oauth.generate_nonce()))
+        request.sign_request(method, consumer, token)
+        requests.append(request)
+    return requests
+
+
+def run(server, requests):
+    start = time.time()
+    for request in requests:
+        server.verify_request(request)
+    return len(requests) / (time.time() - start)
+
+
+def run_signatures(consumer, tokens, requests):
+    method = oauth.OAuthSignatureMethod_HMAC_SHA1()
+    by_key = dict([(x.key, x) for x in tokens])
+    start = time.time()
+    for request in requests:
+        method.build_signature(request, consumer, by_key[request.parameters['oauth_token']])
+    return len(requests) / (time.time() - start)
+
+
+def main():
+    token_count = 2000
+    count = 50000
+    if len(sys.argv) > 1:
+        token_count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        count = int(sys.argv[2])
+
+    consumer = oauth.OAuthConsumer('gateway-consumer', 'gateway secret')
+    tokens = [oauth.OAuthToken('token-%d' % i, 'secret/%d' % i) for i in range(token_count)]
+    requests = make_requests(consumer, tokens, count)
+
+    legacy = LegacyOAuthServer(DictDataStore({consumer.key: consumer},
+                                             dict([(x.key, x) for x in tokens])))
+    legacy.add_signature_method(oauth.OAuthSignatureMethod_HMAC_SHA1())
+
+    store = oauth.MemoryOAuthDataStore()
+    store.add_consumer(consumer)
+    for token in tokens:
+        store.add_token(token)
+    current = oauth.OAuthServer(store)
+    current.add_signature_method(oauth.OAuthSignatureMethod_HMAC_SHA1())
+
+    print '%d tokens, %d requests' % (token_count, count)
+    before = run(legacy, requests)
+    after = run(current, requests)
+    floor = run_signatures(consumer, tokens, requests)
+    print '%-24s %12.0f' % ('before verifies/sec', before)
+    print '%-24s %12.0f  (%.2fx)' % ('after verifies/sec', after, after / before)
+    print '%-24s %12.0f' % ('signature only/sec', floor)
+
+
+if __name__ == '__main__':
+    main()
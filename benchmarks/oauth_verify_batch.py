@@ -0,0 +1,79 @@
+"""
+    Verifications per second for OAuthServer.verify_requests against
+    calling verify_request once per request, for bursts of requests spread
+    over a few hundred tokens
+
+    Each run gets a fresh data store, since verifying uses up the nonces
+
+    Usage: python benchmarks/oauth_verify_batch.py [tokens] [requests] [processes ...]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import oauth
+from oauth_verify import make_requests
+
+
+def make_server(consumer, tokens):
+    store = oauth.MemoryOAuthDataStore()
+    store.add_consumer(consumer)
+    for token in tokens:
+        store.add_token(token)
+    server = oauth.OAuthServer(store)
+    server.add_signature_method(oauth.OAuthSignatureMethod_HMAC_SHA1())
+    return server
+
+
+def run_one_by_one(server, requests):
+    start = time.time()
+    for request in requests:
+        server.verify_request(request)
+    return len(requests) / (time.time() - start)
+
+
+def run_batch(server, requests, processes):
+    # Start the pool before timing, as a gateway would have
+    server.verify_requests(requests[:processes * 2], processes)
+    requests = requests[processes * 2:]
+    start = time.time()
+    results = server.verify_requests(requests, processes)
+    elapsed = time.time() - start
+    errors = [x for x in results if isinstance(x, oauth.OAuthError)]
+    assert not errors, errors[0].message
+    return len(requests) / elapsed
+
+
+def main():
+    token_count = 300
+    count = 30000
+    processes = [1, 2, 4]
+    if len(sys.argv) > 1:
+        token_count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        count = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        processes = [int(x) for x in sys.argv[3:]]
+
+    consumer = oauth.OAuthConsumer('gateway-consumer', 'gateway secret')
+    tokens = [oauth.OAuthToken('token-%d' % i, 'secret/%d' % i) for i in range(token_count)]
+    requests = make_requests(consumer, tokens, count)
+
+    print '%d tokens, %d requests, %d CPUs' % (token_count, count,
+                                               multiprocessing.cpu_count())
+    before = run_one_by_one(make_server(consumer, tokens), requests)
+    print '%-28s %12.0f' % ('verify_request/sec', before)
+    for n in processes:
+        server = make_server(consumer, tokens)
+        after = run_batch(server, requests, n)
+        server.close()
+        print '%-28s %12.0f  (%.2fx)' % ('verify_requests/sec, %d procs' % n,
+                                         after, after / before)
+
+
+if __name__ == '__main__':
+    main()
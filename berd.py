@@ -16,33 +16,91 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import json
+import collections
+from array import array
+import threading
 import urllib2, urllib
 
+from batch import BatchExecutor
+from idset import IdSet, TYPECODE
+from hydrate import UserHydrator
+from instrument import Instrumentation
+from ratelimit import RateLimiter, PRIORITY_WRITE, PRIORITY_READ, PRIORITY_POLL
+from transport import Transport
+
 _base_url = 'http://twitter.com/'
 
 class Twitter():
     """Contains all of the functional methods for the Twitter API
     """
 
-    _opener = urllib2.build_opener()
+    _transport = Transport(_base_url)
+    _cursor_store = None
+    _hydrator = None
+    _verified = None
     authenticated = False
     
-    def __init__(self, uname = '', pword = ''):
+    def __init__(self, uname = '', pword = '', base_url = _base_url, pool = None,
+                 consumer = None, token = None, verified = None):
         """Uname and pword arguments are optional. If they exist, we'll try to authenticate using them
+        With consumer and token, OAuth is used instead
 
         Arguments:
         - 'uname': Username
         - 'pword': Password
+        - 'base_url': Root of the API, defaults to http://twitter.com/
+        - 'pool': transport.ConnectionPool shared by this object and every Paginated it hands out.
+                  If None, a new pool is made with the default limits
+        - 'consumer': oauth.OAuthConsumer for the application
+        - 'token': oauth.OAuthToken, the account's access token
+        - 'verified': verified.VerifiedTokens. A token it says was verified
+                      recently isn't checked with verify_credentials again
         """
-        if self.__make_opener(uname, pword):
+        self._transport = Transport(base_url, pool)
+        if consumer != None:
+            authenticated = self.__make_oauth(consumer, token, verified)
+        else:
+            authenticated = self.__make_opener(uname, pword)
+            if authenticated:
+                self._uname = uname
+        if authenticated:
             print "Authenticated"
-            self._uname = uname
         else:
             print "Unauthenticated"
 
+    def __make_oauth(self, consumer, token, verified):
+        """Sets up OAuth signing on self._transport and works out whose token it is
+
+        Arguments:
+        - `consumer`: oauth.OAuthConsumer
+        - `token`: oauth.OAuthToken
+        - `verified`: verified.VerifiedTokens or None
+        """
+        self._transport.set_oauth(consumer, token)
+        self._transport.set_verified(verified)
+        self._verified = verified
+        if verified != None:
+            screen_name = verified.get(token.key)
+            if screen_name != None:
+                self._uname = screen_name
+                self.authenticated = True
+                return self.authenticated
+        try:
+            data = self._transport.get_json(self._transport.base_url + 'account/verify_credentials.json')
+        except urllib2.HTTPError, e:
+            if e.getcode() == 401:
+                print "401: Invalid OAuth token"
+            self._transport.clear_auth()
+            self.authenticated = False
+            return self.authenticated
+        self._uname = data['screen_name']
+        if verified != None:
+            verified.remember(token.key, self._uname)
+        self.authenticated = True
+        return self.authenticated
+
     def __make_opener(self, uname, pword):
-        """Creates an opener at self.opener
+        """Sets up authentication on self._transport
         Uses basic HTTP authentication
         
         Arguments:
@@ -50,31 +108,31 @@ class Twitter():
         - `pword`: Twitter Password
         """
         
-        auth = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        auth.add_password(None, "http://twitter.com", uname, pword)
-        handler = urllib2.HTTPBasicAuthHandler(auth)
-        self._opener = urllib2.build_opener(handler)
+        self._transport.set_basic_auth(uname, pword)
         try:
-            data = self._opener.open(_base_url + 'account/verify_credentials.json')
+            data = self._transport.open(self._transport.base_url + 'account/verify_credentials.json')
         except urllib2.HTTPError, e:
             if e.getcode() == 401:
                 print "401: Invalid Username or Password"
-            self._opener = urllib2.build_opener()
+            self._transport.clear_auth()
             self.authenticated = False
             return self.authenticated
         else:
+            data.read()
             self.authenticated = True
             return self.authenticated
 
-    def __get_data(self, method, input_data = None):
+    def __get_data(self, method, input_data = None, cacheable = False, priority = PRIORITY_READ):
         """Method that grabs from Twitter and spits out a dict
         
         Arguments:
         - `method`: A method from the twitter API, ie statuses/show
         - `input_data`: A dict containing the arguments
+        - `cacheable`: True for read methods whose responses can be served from the cache
+        - `priority`: ratelimit priority, PRIORITY_WRITE for methods that change something
         """
         #NOTE: Need a smarter way to deal with authentication errors AND non-authentication errors. Perhaps an Error class?
-        url = _base_url + method + '.json'
+        url = self._transport.base_url + method + '.json'
         if input_data == None:
             full_url = url
         else:
@@ -82,11 +140,11 @@ class Twitter():
             full_url = "?".join((url, input_data))
             
         try:
-            http_data = self._opener.open(full_url)
+            data = self._transport.get_json(full_url, cacheable=cacheable, priority=priority)
             
         except urllib2.HTTPError, e:
-            if e.getcode == 401:
-                if self.get_authenticated:
+            if e.getcode() == 401:
+                if self.get_authenticated():
                     print "Object was authenticated, but now it's not. Password changed, possibly?"
                     raise e
                 print "401: Invalid Username or Password"
@@ -96,7 +154,6 @@ class Twitter():
                 raise e
             return False
         else:
-            data = json.load(http_data)
             return data
 
     def get_authenticated(self):
@@ -105,28 +162,124 @@ class Twitter():
         """
         return self.authenticated
 
+    def pool_stats(self):
+        """Returns a dict of connection pool counters (hits, misses, open, idle)
+        Shared with every Paginated object this one hands out
+        """
+        return self._transport.pool.stats()
+
+    def set_cache(self, cache):
+        """Caches responses to read methods (get_status, friends_ids and so on)
+        Repeat calls send conditional requests, and a 304 is answered from the
+        cache instead of downloading the same body again
+        
+        Arguments:
+        - `cache`: httpcache.MemoryCache, httpcache.DiskCache, or None to stop caching
+        """
+        self._transport.set_cache(cache)
+
+    def cache_stats(self):
+        """Returns a dict with the cache's hit, miss and bytes_saved counters, or None
+        """
+        if self._transport.cache == None:
+            return None
+        return self._transport.cache.stats()
+
+    def enable_rate_limiting(self, limiter=None):
+        """Makes every request (this object's and its Paginated objects') wait
+        for quota instead of failing once the rate limit is hit
+        Writes like set_status go ahead of timeline polling in the queue
+
+        Returns the RateLimiter
+        
+        Arguments:
+        - `limiter`: RateLimiter to use. If None, one is made and seeded from rate_limit_status
+        """
+        if limiter == None:
+            limiter = RateLimiter()
+            limiter.seed(self.rate_limit_status())
+        self._transport.set_limiter(limiter)
+        return limiter
+
+    def rate_limit_stats(self):
+        """Returns a dict with the rate limiter's view of the quota, or None
+        """
+        if self._transport.limiter == None:
+            return None
+        return self._transport.limiter.stats()
+
+    def set_instrumentation(self, instrumentation=None):
+        """Starts recording timings, latency histograms and byte counts for
+        every request this object and its Paginated objects make
+        Returns the instrument.Instrumentation, which has the hooks and snapshot()
+
+        Arguments:
+        - `instrumentation`: Instrumentation to record into. A new one is made if None
+        """
+        if instrumentation == None:
+            instrumentation = Instrumentation()
+        self._transport.set_instrumentation(instrumentation)
+        return instrumentation
+
+    def clear_instrumentation(self):
+        """Stops recording requests
+        """
+        self._transport.set_instrumentation(None)
+
+    def instrumentation_snapshot(self):
+        """Returns the Instrumentation's snapshot dict, or None if it isn't on
+        """
+        if self._transport.instrumentation == None:
+            return None
+        return self._transport.instrumentation.snapshot()
+
+    def __models(self, method, data, factory):
+        """factory(x) for x in data, timed as model construction when instrumented
+        """
+        instr = self._transport.instrumentation
+        if instr == None:
+            return (factory(x) for x in data)
+        return instr.build(self._transport.endpoint(method), data, factory)
+
+    def set_cursor_store(self, store):
+        """Every Paginated handed out from now on saves its since_id and page
+        to store, and starts from where it left off last time
+        
+        Arguments:
+        - `store`: cursors.FileCursorStore, cursors.SQLiteCursorStore, or None
+        """
+        self._cursor_store = store
+
+    def _with_cursor(self, paginated):
+        if self._cursor_store != None:
+            # Keyed on the account too, so timelines like mentions don't clash
+            key = '%s:%s' % (getattr(self, '_uname', ''),
+                             paginated._url[len(self._transport.base_url):])
+            paginated.set_cursor_store(self._cursor_store, key)
+        return paginated
+
     def friends_timeline(self):
         """ Returns a Paginated object set for Friends Timeline
         """
-        return Paginated('statuses/friends_timeline', self._opener)
+        return self._with_cursor(Paginated('statuses/friends_timeline', self._transport))
 
     def public_timeline(self):
         """ Returns a Paginated object set for Public Timeline
         """
-        return Paginated('statuses/public_timeline', self._opener)
+        return self._with_cursor(Paginated('statuses/public_timeline', self._transport))
 
     def user_timeline(self, user_id = None):
         """ Returns a UTimelinePaginted (Paginated) object set for an arbirary user's timeline
         """
         if user_id == None:
-            return Paginated('statuses/user_timeline', self._opener)
+            return self._with_cursor(Paginated('statuses/user_timeline', self._transport))
         else:
-            return UTimelinePaginated(self._opener, user_id)
+            return self._with_cursor(UTimelinePaginated(self._transport, user_id))
 
     def mentions(self):
         """ Returns a Paginated object set for User's Mentions (@replies)
         """
-        return Paginated('statuses/mentions')
+        return self._with_cursor(Paginated('statuses/mentions', self._transport))
 
     def set_status(self, status, in_reply_to_status_id=None):
         """Sets the user's status.
@@ -144,7 +297,18 @@ class Twitter():
         else:
             input_data = {'status': status, 'in_reply_to_status_id': in_reply_to_status_id}
 
-        return Status(self.__get_data('statuses/update', input_data))
+        return Status(self.__get_data('statuses/update', input_data, priority=PRIORITY_WRITE))
+
+    def run_batch(self, operations, workers=4, retries=3):
+        """Runs many write operations at once, ie cleaning out old statuses
+        Returns a list of batch.BatchResult, one per operation, in order
+
+        Arguments:
+        - `operations`: List of (method name, arg, ...) tuples, ie ('destroy_status', 1234)
+        - `workers`: Requests in flight at once
+        - `retries`: Times a 5xx or network error is retried
+        """
+        return BatchExecutor(self, workers, retries).run(operations)
 
     def get_status(self, status_id):
         """Retrieves a Status by ID
@@ -152,7 +316,7 @@ class Twitter():
         Arguments:
         - `status_id`: Status ID
         """
-        data = self.__get_data("/statuses/show/%s" % status_id)
+        data = self.__get_data("/statuses/show/%s" % status_id, cacheable=True)
         status = Status(data)
         return status
 
@@ -163,7 +327,7 @@ class Twitter():
         Arguments:
         - `status_id`: ID of the status item to destroy
         """
-        data = self.__get_data("/statuses/destroy/%s" % status_id)
+        data = self.__get_data("/statuses/destroy/%s" % status_id, priority=PRIORITY_WRITE)
         status = Status(data)
         return status
 
@@ -171,13 +335,13 @@ class Twitter():
         """Returns a Paginated object for the Authenticated User
         """
         
-        return DirectMessagePaginated('direct_messages', self._opener)
+        return self._with_cursor(DirectMessagePaginated('direct_messages', self._transport))
         
     def sent_direct_messages(self):
         """ Returns a Paginated object for direct messages sent by the Authenticated User
         """
         
-        return DirectMessagePaginated('direct_messages/sent', self._opener)
+        return self._with_cursor(DirectMessagePaginated('direct_messages/sent', self._transport))
 
     def new_direct_message(self, user, text):
         """Send a direct message to User
@@ -189,7 +353,7 @@ class Twitter():
         """
         input_data = {'user': user, 'text': text}
         return DirectMessage(
-            self.__get_data('direct_messages/new', input_data)
+            self.__get_data('direct_messages/new', input_data, priority=PRIORITY_WRITE)
             )
 
     def destroy_direct_message(self, id):
@@ -200,7 +364,7 @@ class Twitter():
         """
 
         return DirectMessage(
-            self.__get_data('direct_messages/destroy/%s' % id)
+            self.__get_data('direct_messages/destroy/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def friendship_create(self, id, follow=True):
@@ -214,8 +378,8 @@ class Twitter():
         """
         
         input_data = {'follow': follow }
-        return User(
-            self.__get_data('friendships/create/%s' % id, input_data)
+        return get_user(
+            self.__get_data('friendships/create/%s' % id, input_data, priority=PRIORITY_WRITE)
             )
 
     def friendship_destroy(self, id):
@@ -227,8 +391,8 @@ class Twitter():
         - `id`: Screenname or ID
         """
         
-        return User(
-            self.__get_data('friendships/destroy/%s' % id)
+        return get_user(
+            self.__get_data('friendships/destroy/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def friendship_show_by_id(self, target_user_id, source_user_id = None):
@@ -243,7 +407,7 @@ class Twitter():
         input_data = {'target_id': target_user_id}
         if not source_user_id == None:
             input_data.update({'source_id': source_user_id})
-        return __get_data('friendships/show', input_data)
+        return self.__get_data('friendships/show', input_data, True)
 
     def friendship_show_by_screenname(self, target_screenname, source_screenname = None):
         """Show a relationship between two users taking screenname as an argument
@@ -257,19 +421,50 @@ class Twitter():
         input_data = {'target_screen_name': target_screenname}
         if not source_screenname == None:
             input_data.update({'source_screen_name': source_screenname})
-        return self.__get_data('friendships/show', input_data)
+        return self.__get_data('friendships/show', input_data, True)
 
     def friends_ids(self):
         """Returns an array of user_ids for the Authenticated user's friends
         """
 
-        return self.__get_data('friends/ids')
+        return self.__get_data('friends/ids', cacheable=True)
 
     def followers_ids(self):
         """Returns an array of user_ids for every user the Authenticated user is following
         """
 
-        return self.__get_data('followers/ids')
+        return self.__get_data('followers/ids', cacheable=True)
+
+    def users_lookup(self, user_ids):
+        """Returns a list of User objects for up to 100 user ids in one request
+        Ids Twitter doesn't know (suspended or deleted accounts) are left out
+        
+        Arguments:
+        - `user_ids`: List of User IDs, 100 at most
+        """
+
+        input_data = {'user_id': ','.join([str(x) for x in user_ids])}
+        try:
+            data = self.__get_data('users/lookup', input_data)
+        except urllib2.HTTPError, e:
+            # None of them were found
+            if e.getcode() == 404:
+                return []
+            raise
+        return [get_user(x) for x in data or []]
+
+    def hydrate_users(self, user_ids):
+        """Generator of User objects for any number of user ids, in the same
+        order, fetched 100 at a time over a few concurrent requests
+        Users fetched in the last hour by this object aren't fetched again
+        See hydrate.UserHydrator for the knobs
+        
+        Arguments:
+        - `user_ids`: Iterable of User IDs, ie from friends_ids or followers_ids
+        """
+        if self._hydrator == None:
+            self._hydrator = UserHydrator(self)
+        return self._hydrator.hydrate(user_ids)
 
     def favorites(self, page=1, screenname=None):
         """Returns an array of favorites for the specified screenname (or if None, then the Authenticated user
@@ -283,12 +478,13 @@ class Twitter():
 
         input_data = {'page': page}
         if screenname == None:
-            data = self.__get_data('favorites', input_data)
+            method = 'favorites'
         else:
-            data = self.__get_data('favorites/%s' % screenname, input_data)
+            method = 'favorites/%s' % screenname
+        data = self.__get_data(method, input_data)
 
-        for x in data:
-            yield Status(x)
+        for x in self.__models(method, data, Status):
+            yield x
 
     def favorite_create(self, id):
         """Sets status as a favorite of the Authenticated user
@@ -300,7 +496,7 @@ class Twitter():
         """
         
         return Status(
-            self.__get_data('favorites/create/%s' % id)
+            self.__get_data('favorites/create/%s' % id, priority=PRIORITY_WRITE)
             )
     
     def favorite_destroy(self, id):
@@ -313,7 +509,7 @@ class Twitter():
         """
 
         return Status(
-            self.__get_data('favorites/destroy/%s' % id)
+            self.__get_data('favorites/destroy/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def notifications_follow(self, id):
@@ -326,8 +522,8 @@ class Twitter():
         - `id`: Screenname or User ID
         """
         
-        return User(
-            self.__get_data('notifications/follow/%s' % id)
+        return get_user(
+            self.__get_data('notifications/follow/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def notifications_leave(self, id):
@@ -341,8 +537,8 @@ class Twitter():
         - `id`: Screenname or User ID
         """
 
-        return User(
-            self.__get_data('notifications/leave/%s' % id)
+        return get_user(
+            self.__get_data('notifications/leave/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def block_create(self, id):
@@ -354,8 +550,8 @@ class Twitter():
         - `id`: Screenname or User ID
         """
 
-        return User(
-            self.__get_data('blocks/create/%s' % id)
+        return get_user(
+            self.__get_data('blocks/create/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def block_destroy(self, id):
@@ -365,8 +561,8 @@ class Twitter():
         - `id`: Screenname or User ID
         """
 
-        return User(
-            self.__get_data('blocks/destroy/%s' % id)
+        return get_user(
+            self.__get_data('blocks/destroy/%s' % id, priority=PRIORITY_WRITE)
             )
 
     def block_exists(self, id):
@@ -379,7 +575,7 @@ class Twitter():
         """
 
         try:
-            return User(
+            return get_user(
                 self.__get_data('blocks/exists/%s' % id)
                 )
         except urllib2.HTTPError, e:
@@ -395,20 +591,67 @@ class Twitter():
 
         input_data = {'page': page}
         data = self.__get_data('blocks/blocking', input_data)
-        for x in data:
-            yield User(x)
+        for x in self.__models('blocks/blocking', data, get_user):
+            yield x
 
     def block_ids(self):
         """Returns an array of user ids which the Authenticated user has blocked
         """
 
-        return self.__get_data('blocks/blocking/ids')
+        return self.__get_data('blocks/blocking/ids', cacheable=True)
+
+    def __id_set(self, method, input_data=None):
+        """Pages through an ids method with cursor=-1, next_cursor... and
+        collects every id straight into an IdSet
+        Methods that don't page just hand back a plain list, which is fine too
+        Pages are cacheable, so with set_cache a page that hasn't changed is a 304
+        """
+        ids = array(TYPECODE)
+        input_data = dict(input_data or {})
+        cursor = -1
+        while cursor:
+            input_data['cursor'] = cursor
+            data = self.__get_data(method, input_data, cacheable=True)
+            if isinstance(data, list):
+                ids.extend(data)
+                break
+            ids.extend(data['ids'])
+            cursor = data['next_cursor']
+        return IdSet(ids)
+
+    def friend_id_set(self, user_id = None):
+        """Returns an idset.IdSet of the user_ids the Authenticated user (or user_id) follows
+        Pages through every cursor, so it's the whole list
+        
+        Arguments:
+        - `user_id`: User to get friends for, None for the Authenticated user
+        """
+        if user_id == None:
+            return self.__id_set('friends/ids')
+        return self.__id_set('friends/ids', {'user_id': user_id})
+
+    def follower_id_set(self, user_id = None):
+        """Returns an idset.IdSet of the user_ids following the Authenticated user (or user_id)
+        Pages through every cursor, so it's the whole list
+        
+        Arguments:
+        - `user_id`: User to get followers for, None for the Authenticated user
+        """
+        if user_id == None:
+            return self.__id_set('followers/ids')
+        return self.__id_set('followers/ids', {'user_id': user_id})
+
+    def block_id_set(self):
+        """Returns an idset.IdSet of the user_ids the Authenticated user has blocked
+        """
+        return self.__id_set('blocks/blocking/ids')
 
     def rate_limit_status(self):
         """Returns the rate limit for the Authenticated User (or IP if not Authenticated)
         """
 
-        return self.__get_data('account/rate_limit_status')
+        # Doesn't count against the limit, so it skips the queue
+        return self.__get_data('account/rate_limit_status', cacheable=True, priority=None)
 
         
 
@@ -417,15 +660,24 @@ class Paginated():
         (as well as the since_id and max_id args)
         """
     
-        def __init__(self, method, opener):
+        def __init__(self, method, transport):
             """
+
+            Arguments:
+            - `method`: Twitter method to use (ie: 'statuses/friends_timeline')
+            - `transport`: transport.Transport object from Twitter class
             """
             self._method = method
-            self._opener = opener
+            self._transport = transport
             self._page = 1
             self._count = 20
             self._last_id = None
-            self._url = _base_url + self._method + '.json'
+            self._streaming = False
+            self._lazy = False
+            self._gap_fill = False
+            self._cursor_store = None
+            self._cursor_key = None
+            self._url = transport.base_url + self._method + '.json'
 
         def set_count(self, count):
             """ Sets the number of results per page
@@ -433,9 +685,9 @@ class Paginated():
             
             # Do some checking to make sure we don't go over Twitter's limit
             if count > 3200:
-                self.count = 3200
+                self._count = 3200
             elif count < 1:
-                self.count = 1
+                self._count = 1
             else:
                 self._count = count
             return self._count
@@ -443,31 +695,94 @@ class Paginated():
         def get_count(self):
             return self._count
 
-        def __get_data(self, input_data=None):
+        def set_streaming(self, streaming=True):
+            """ Turns incremental decoding on or off
+            When on, responses are decoded one status at a time straight off the
+            socket, so the first Status is ready before the rest of the page has
+            arrived and only one is held in memory at a time. _last_id is updated
+            once the first Status has been read
+            """
+            self._streaming = streaming
+
+        def set_cursor_store(self, store, key=None):
+            """ Saves _last_id and the page to store whenever they change, and
+            picks them back up from store right now if it has them
+
+            Arguments:
+            - `store`: cursors.CursorStore, or None to stop saving
+            - `key`: Name to save under, defaults to the URL of this method
+            """
+            if key == None:
+                key = self._url
+            self._cursor_store = store
+            self._cursor_key = key
+            if store != None:
+                state = store.load(key)
+                if state != None:
+                    self._last_id = state.get('last_id')
+                    self._page = state.get('page') or 1
+
+        def _checkpoint(self):
+            if self._cursor_store != None:
+                self._cursor_store.save(self._cursor_key,
+                                        {'last_id': self._last_id, 'page': self._page})
+
+        def set_gap_fill(self, gap_fill=True):
+            """ Turns gap filling on or off for next_tweets
+            Normally next_tweets asks for count tweets since the last one it saw,
+            so if more than count arrived in between, the older ones are skipped.
+            With gap filling on, a full page makes next_tweets walk back with max_id
+            until it meets the last tweet it saw, so nothing is skipped and you can
+            poll less often with a smaller count
+            If a request fails partway, _last_id isn't moved and the next call
+            covers the gap again (so you may see some tweets twice, but never miss any)
+            Gap filling buffers each response, so it doesn't stream
+            """
+            self._gap_fill = gap_fill
+
+        def set_lazy(self, lazy=True):
+            """ Turns lazy Statuses on or off
+            Lazy Statuses only read id up front, which is much cheaper when most of
+            them get thrown away after a look at id or user_id. See Status
+            """
+            self._lazy = lazy
+
+        def _full_url(self, input_data=None):
             # url = _base_url + self._method + '.json'
-            
             if not input_data==None:
                 input_data = urllib.urlencode(input_data)
-                full_url = "?".join((self._url, input_data))
+                return "?".join((self._url, input_data))
             else:
-                full_url = self._url
+                return self._url
+
+        def __get_data(self, input_data=None, stream=None):
+            if stream == None:
+                stream = self._streaming
+            full_url = self._full_url(input_data)
                 
             try:
-                http_data = self._opener.open(full_url)
+                data = self._transport.get_json(full_url, priority=PRIORITY_POLL, stream=stream)
             except urllib2.HTTPError, e:
-                if e.getcode == 401:
+                if e.getcode() == 401:
                     print "401: Invalid Username or Password"
                 return False
             else:
-                data = json.load(http_data)
                 return data
 
         def to_status(self, data):
             """ Uses a generator to yield a set of Statuses
             This method is to shave off a couple lines of code and make life easier when extending this class
             """
+            lazy = self._lazy
+            instr = self._transport.instrumentation
+            if instr != None:
+                data = instr.build(self._transport.endpoint(self._url), data,
+                                   lambda x: Status(x, lazy))
+                for x in data:
+                    yield x
+                return
             for x in data:
-                yield Status(x)
+                yield Status(x, lazy)
 
         def get_tweets(self):
             """ Use this is get a list of tweets for this method
@@ -478,7 +793,7 @@ class Paginated():
             self._page = 1
             input_data = {'count': self._count}
             data = self.__get_data(input_data)
-            self._last_id = data[0]['id']
+            data = self._update_last_id(data)
 
             return self.to_status(data)
             # for x in data:
@@ -491,35 +806,88 @@ class Paginated():
             """
             
             self._page = 1
+            if self._gap_fill and self._last_id != None:
+                data, complete = self._fill_gap(self.__get_data(self._next_tweets_input(), False))
+                if complete:
+                    data = self._update_last_id(data)
+            else:
+                data = self.__get_data(self._next_tweets_input())
+                data = self._update_last_id(data)
+
+            return self.to_status(data)
+            # for x in data:
+            #     yield Status(x)
+
+        def _fill_gap(self, data):
+            """ If data is a full page there may be more tweets between it and
+            since_id. Walks back with max_id, a page at a time, until a page comes
+            back short, which means we've reached since_id
+
+            Returns (all the tweets, True), or (what we got, False) if one of the
+            requests failed and the gap is still open
+            """
+            if not data:
+                return data, data != False
+            since_id = self._last_id
+            pages = [data]
+            page = data
+            while len(page) >= self._count:
+                input_data = {'count': self._count, 'since_id': since_id,
+                              'max_id': page[-1]['id'] - 1}
+                page = self.__get_data(input_data, False)
+                if page == False:
+                    break
+                if page:
+                    pages.append(page)
+            data = [x for page in pages for x in page]
+            return data, page != False
+
+        def _next_tweets_input(self):
+            """ Arguments for next_tweets: count, plus since_id once we've seen a tweet
+            """
             if self._last_id == None:
-                input_data = {'count': self._count}
+                return {'count': self._count}
             else:
-                input_data = {'count': self._count, 'since_id': self._last_id}
+                return {'count': self._count, 'since_id': self._last_id}
 
-            data = self.__get_data(input_data)
-            # if there is a blank list, just output nothing
+        def _update_last_id(self, data):
+            """ Remembers the newest id in data and returns data
+            A blank list leaves _last_id alone. A streamed response is wrapped so
+            the id is picked up as the first item goes by
+            """
+            if not isinstance(data, list):
+                return self._track_last_id(data)
             try:
                 last_id = data[0]['id']
             except IndexError:
                 pass
             else:
                 self._last_id = last_id
-                # self._last_id = data[0]['id']
+                self._checkpoint()
+            return data
 
-            return self.to_status(data)
-            # for x in data:
-            #     yield Status(x)
+        def _track_last_id(self, data):
+            first = True
+            for x in data:
+                if first:
+                    self._last_id = x['id']
+                    self._checkpoint()
+                    first = False
+                yield x
+
+        def _page_input(self, page):
+            """ Arguments for retrieve_page
+            """
+            if self._last_id == None:
+                return {'count': self._count, 'page': page}
+            else:
+                return {'count': self._count, 'page': page, 'max_id': self._last_id}
 
         def retrieve_page(self, page):
             """ Get an arbitrary page from this Twitter method
             """
             
-            if self._last_id == None:
-                input_data = {'count': self._count, 'page': page}
-            else:
-                input_data = {'count': self._count, 'page': page, 'max_id': self._last_id}
-
-            data = self.__get_data(input_data)
+            data = self.__get_data(self._page_input(page))
 
             return self.to_status(data)
             # for x in data:
@@ -530,52 +898,175 @@ class Paginated():
             """
             
             self._page = self._page + 1
+            self._checkpoint()
 
             return self.retrieve_page(self._page)
 
+        def iter_pages(self, start=1, window=4):
+            """ Generator over pages start, start+1, ... of this Twitter method
+            Each item is a list of Statuses. While you work through page N, pages
+            N+1 to N+window are fetched on background threads
+            Stops at the first empty page. A page that fails (ie a 503) raises its
+            urllib2.HTTPError here when its turn comes. Stop iterating (or close()
+            the generator) to cancel the read-ahead
+
+            Arguments:
+            - `start`: First page to return
+            - `window`: How many pages to fetch ahead of the one being consumed
+            """
+            cond = threading.Condition()
+            state = {'next': start, 'consumed': start, 'end': None, 'stop': False}
+            pages = {}
+            # Every page is pinned to the max_id we started with
+            max_id = self._last_id
+
+            def page_input(page):
+                input_data = {'count': self._count, 'page': page}
+                if max_id != None:
+                    input_data['max_id'] = max_id
+                return input_data
+
+            def worker():
+                while True:
+                    cond.acquire()
+                    try:
+                        while True:
+                            page = state['next']
+                            if state['stop'] or (state['end'] != None and page > state['end']):
+                                return
+                            if page < state['consumed'] + window:
+                                break
+                            cond.wait()
+                        state['next'] = page + 1
+                    finally:
+                        cond.release()
+
+                    # Straight to the transport: __get_data turns HTTP errors
+                    # into False, which would look like the end of the timeline
+                    try:
+                        data = self._transport.get_json(self._full_url(page_input(page)),
+                                                        priority=PRIORITY_POLL)
+                    except Exception, e:
+                        data = e
+
+                    cond.acquire()
+                    try:
+                        pages[page] = data
+                        if data == [] or isinstance(data, Exception):
+                            if state['end'] == None or page < state['end']:
+                                state['end'] = page
+                        cond.notify_all()
+                    finally:
+                        cond.release()
+
+            for x in range(window):
+                thread = threading.Thread(target=worker)
+                thread.setDaemon(True)
+                thread.start()
+
+            try:
+                page = start
+                while True:
+                    cond.acquire()
+                    try:
+                        while page not in pages:
+                            cond.wait()
+                        data = pages.pop(page)
+                        state['consumed'] = page + 1
+                        cond.notify_all()
+                    finally:
+                        cond.release()
+
+                    if isinstance(data, Exception):
+                        raise data
+                    if data == []:
+                        return
+                    self._page = page
+                    yield list(self.to_status(data))
+                    page = page + 1
+            finally:
+                cond.acquire()
+                state['stop'] = True
+                cond.notify_all()
+                cond.release()
+
 class UTimelinePaginated(Paginated):
-    def __init__(self, opener, user_id):
+    def __init__(self, transport, user_id):
         method = 'statuses/user_timeline'
         self.user_id = user_id
-        Paginated.__init__(self, method, opener)
-        self._url = _base_url + self._method + '/' + self.user_id + '.json'
-
+        Paginated.__init__(self, method, transport)
+        self._url = transport.base_url + self._method + '/' + str(self.user_id) + '.json'
 
-class User():
-    """Class to deal with Twitter users
 
-    user_dict variable is available for anything not stored in the class itself
-    (like color preferences)
+def _extra_fields(raw_dict, fields):
+    """Returns a dict of whatever in raw_dict isn't one of fields, or None if
+    that's nothing
     """
-    id = None
-    name = None
-    screen_name = None
-    url = None
-    profile_image_url = None
-    description = None
-    location = None
-    
-    followers_count = None
-    friends_count = None
+    extra = None
+    for k in raw_dict:
+        if k not in fields:
+            if extra == None:
+                extra = {}
+            extra[k] = raw_dict[k]
+    return extra
+
+def _rebuild_dict(obj, fields):
+    """Puts the dict a model object was built from back together
+    """
+    raw_dict = dict(obj._extra or ())
+    for k in fields:
+        raw_dict[k] = getattr(obj, k)
+    return raw_dict
+
+def _slot_state(obj):
+    """Returns a dict of the slots obj has filled in, for pickling. Unset
+    slots (the unread fields of a lazy Status) are left out rather than built
+    """
+    state = {}
+    for name in obj.__slots__:
+        try:
+            state[name] = object.__getattribute__(obj, name)
+        except AttributeError:
+            pass
+    return state
 
-    statuses_count = None
-    created_ad = None
-    protected = None
-    utc_offset = None
+def _set_slot_state(obj, state):
+    for name, value in state.iteritems():
+        object.__setattr__(obj, name, value)
 
-    user_dict = None
 
-    def __init__(self, user_dict):
+class User(object):
+    """Class to deal with Twitter users
+
+    Every field is stored once, in a slot. Anything Twitter sends that isn't
+    stored in the class itself (like color preferences) is kept on the side,
+    and user_dict puts the whole thing back together when it's asked for
+    """
+    _fields = ('id', 'name', 'screen_name', 'url', 'profile_image_url',
+               'description', 'location', 'followers_count', 'friends_count',
+               'statuses_count', 'created_at', 'protected', 'utc_offset')
+    __slots__ = _fields + ('_extra',)
+    _known = frozenset(_fields)
+    # Fields that depend on which account asked, left off a shared User
+    _viewer_fields = frozenset(('following', 'notifications', 'follow_request_sent'))
+    _known_shared = _known | _viewer_fields
+
+    def __init__(self, user_dict, shared=False):
         """
+        Use get_user instead to get the shared User for this id
         
         Arguments:
         - `user_dict`: Dictionary from a twitter method
+        - `shared`: True for a User kept in a UserCache, which drops the
+                    fields that depend on the account that asked
         """
-        self.user_dict = user_dict
-
         if 'user' in user_dict:
             user_dict = user_dict['user']
-            
+        self._load(user_dict, shared)
+
+    def _load(self, user_dict, shared=False):
+        """Fills in (or refreshes) every field from user_dict
+        """
         self.id = user_dict['id']
         self.name = user_dict['name']
         self.screen_name = user_dict['screen_name']
@@ -591,11 +1082,38 @@ class User():
             pass
         # End Hack
         self.followers_count = user_dict['followers_count']
-        self.friend_count = user_dict['friends_count']
+        self.friends_count = user_dict['friends_count']
         self.statuses_count = user_dict['statuses_count']
         self.created_at = user_dict['created_at']
         self.protected = user_dict['protected']
         self.utc_offset = user_dict['utc_offset']
+        if shared:
+            self._extra = _extra_fields(user_dict, self._known_shared)
+        else:
+            self._extra = _extra_fields(user_dict, self._known)
+
+    @property
+    def user_dict(self):
+        """The user's dict as Twitter sent it (with the apostrophe fix applied)
+        Built on request, so don't hang on to it
+        """
+        return _rebuild_dict(self, self._fields)
+
+    @property
+    def friend_count(self):
+        """Old name for friends_count
+        """
+        return self.friends_count
+
+    def _is_stale(self, user_dict):
+        return (self.statuses_count != user_dict['statuses_count'] or
+                self.followers_count != user_dict['followers_count'])
+
+    def __getstate__(self):
+        return _slot_state(self)
+
+    def __setstate__(self, state):
+        _set_slot_state(self, state)
 
     def __str__(self):
         return '@' + self.screen_name + ': ' + self.name
@@ -646,46 +1164,215 @@ class User():
         """
         return twitter.block_destroy(self.id)
 
-    
-    
 
-            
-class Status():
+class UserCache(object):
+    """Identity map of User objects keyed on user id
+
+    Every status, direct message and friendship result for the same account
+    shares one User. When a newer dict shows a different statuses_count or
+    followers_count, the shared User is refreshed in place. The least
+    recently used Users are dropped past max_size
+
+    Since every account in the process sees the same User, fields that
+    depend on the account asking (following, notifications and
+    follow_request_sent) aren't kept on it
+    """
+
+    def __init__(self, max_size=10000):
+        """
+
+        Arguments:
+        - `max_size`: Most Users to keep
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._users = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_user(self, user_dict):
+        """Returns the shared User for user_dict, making or refreshing it as needed
+        """
+        if 'user' in user_dict:
+            user_dict = user_dict['user']
+        user_id = user_dict['id']
+        self._lock.acquire()
+        try:
+            user = self._users.pop(user_id, None)
+            if user != None:
+                # Back on the end as most recently used
+                self._users[user_id] = user
+                if user._is_stale(user_dict):
+                    user._load(user_dict, True)
+                    self.refreshes += 1
+                else:
+                    self.hits += 1
+                return user
+            self.misses += 1
+        finally:
+            self._lock.release()
+
+        user = User(user_dict, True)
+        self._lock.acquire()
+        try:
+            # Another thread might have beaten us to it
+            user = self._users.setdefault(user_id, user)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        finally:
+            self._lock.release()
+        return user
+
+    def get(self, user_id):
+        """Returns the cached User for user_id, or None
+        """
+        return self._users.get(user_id)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._users.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._users)
+
+    def stats(self):
+        """Returns a dict with the hit, miss and refresh counters
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'refreshes': self.refreshes, 'size': len(self._users)}
+
+
+_user_cache = UserCache()
+
+def set_user_cache(cache):
+    """Sets the UserCache used by get_user. None turns sharing off, so every
+    dict gets its own User again
+    """
+    global _user_cache
+    _user_cache = cache
+
+def get_user_cache():
+    return _user_cache
+
+def get_user(user_dict):
+    """Returns the User for user_dict, shared through the UserCache if there is one
+    """
+    cache = _user_cache
+    if cache == None:
+        return User(user_dict)
+    return cache.get_user(user_dict)
+
+
+def _fix_text(text):
+    # HACK! Fix for apostrophe error in Python
+    text = text.replace(u'\u2019', u'\u0027')
+    return text.replace(u'\u201c', u'\u0027')
+
+
+class Status(object):
     """ Class to deal with Twitter statuses
     
-    status_dict variable stores the original dict just in case Twitter adds more
-    variables to the response
+    status_dict rebuilds the original dict just in case Twitter adds more
+    variables to the response. Fields that aren't stored in the class are
+    kept on the side for it
+
+    A lazy Status only reads id up front and hangs on to the decoded dict.
+    Every other field (text, user and so on) is built the first time it's
+    looked at, then kept
     """
-    status_dict = None
-
-    favorited = None
-    truncated = None
-    text = None
-    created_at = None
-    source = None
-    in_reply_to_status_id = None
-    in_reply_to_screen_name = None
-    id = None
-    in_reply_to_user_id = None
-    user = None
-
-    def __init__(self, status_dict):
-        self.status_dict = status_dict
-        
+    _fields = ('favorited', 'truncated', 'text', 'created_at', 'source',
+               'in_reply_to_status_id', 'in_reply_to_screen_name', 'id',
+               'in_reply_to_user_id')
+    __slots__ = _fields + ('user', '_extra', '_raw')
+    _known = frozenset(_fields + ('user',))
+
+    def __init__(self, status_dict, lazy=False):
+        """
+
+        Arguments:
+        - `status_dict`: Dict from a twitter response
+        - `lazy`: If True, fields are filled in from status_dict as they're used
+        """
+        self.id = status_dict['id']
+        if lazy:
+            self._raw = status_dict
+            return
+        self._raw = None
+
         self.favorited = status_dict['favorited']
         self.truncated = status_dict['truncated']
-        self.text = status_dict['text']
-        # HACK! Fix for apostrophe error in Python
-        self.text = self.text.replace(u'\u2019', u'\u0027')
-        self.text = self.text.replace(u'\u201c', u'\u0027')
+        self.text = _fix_text(status_dict['text'])
         self.created_at = status_dict['created_at']
         self.source = status_dict['source']
         self.in_reply_to_status_id = status_dict['in_reply_to_status_id']
         self.in_reply_to_screen_name = status_dict['in_reply_to_screen_name']
-        self.id = status_dict['id']
         self.in_reply_to_user_id = status_dict['in_reply_to_user_id']
 
-        self.user = User(status_dict['user'])
+        self.user = get_user(status_dict['user'])
+        self._extra = _extra_fields(status_dict, self._known)
+
+    def __getattr__(self, name):
+        # Only called for slots that haven't been filled in, which only
+        # happens on a lazy Status. Also asked for things like __setstate__
+        # while unpickling, before _raw is filled in
+        if name[:2] == '__':
+            raise AttributeError(name)
+        try:
+            raw = object.__getattribute__(self, '_raw')
+        except AttributeError:
+            raise AttributeError(name)
+        if raw == None or (name not in self._known and name != '_extra'):
+            raise AttributeError(name)
+        if name == 'text':
+            value = _fix_text(raw['text'])
+        elif name == 'user':
+            value = get_user(raw['user'])
+        elif name == '_extra':
+            value = _extra_fields(raw, self._known)
+        else:
+            value = raw[name]
+        setattr(self, name, value)
+        return value
+
+    def __getstate__(self):
+        return _slot_state(self)
+
+    def __setstate__(self, state):
+        _set_slot_state(self, state)
+
+    def materialize(self):
+        """Fills in every field of a lazy Status and lets go of its dict
+        Worth doing for the statuses you're keeping around
+        """
+        if self._raw == None:
+            return self
+        for name in self._fields + ('user', '_extra'):
+            getattr(self, name)
+        self._raw = None
+        return self
+
+    @property
+    def user_id(self):
+        """The author's id, without building a User on a lazy Status
+        """
+        if self._raw == None:
+            return self.user.id
+        return self._raw['user']['id']
+
+    @property
+    def status_dict(self):
+        """The status's dict as Twitter sent it (with the apostrophe fix applied
+        unless the Status is lazy). Built on request, so don't hang on to it
+        """
+        if self._raw != None:
+            return self._raw
+        status_dict = _rebuild_dict(self, self._fields)
+        status_dict['user'] = self.user.user_dict
+        return status_dict
 
     def __str__(self):
         return '@' + self.user.screen_name + ': ' + self.text
@@ -715,18 +1402,14 @@ class Status():
 
         
 
-class DirectMessage():
+class DirectMessage(object):
     """Class to handle Twitter Direct Messages
     
-    Reveals dm_dict, which contains the original dict just in case Twitter decides to add more information to the response than what this class handles
+    Reveals dm_dict, which rebuilds the original dict just in case Twitter decides to add more information to the response than what this class handles
     """
-
-    id = None
-    dm_dict = None
-    sender = None
-    text = None
-    created_at = None
-    recipient = None
+    _fields = ('id', 'text', 'created_at')
+    __slots__ = _fields + ('sender', 'recipient', '_extra')
+    _known = frozenset(_fields + ('sender', 'recipient'))
     
     def __init__(self, dm_dict):
         """
@@ -734,13 +1417,28 @@ class DirectMessage():
         Arguments:
         - `dm_dict`: Dict from a twitter response
         """
-        self.dm_dict = dm_dict
-
         self.id = dm_dict['id']
-        self.sender = User(dm_dict['sender'])
+        self.sender = get_user(dm_dict['sender'])
         self.text = dm_dict['text']
         self.created_at = dm_dict['created_at']
-        self.recipient = User(dm_dict['recipient'])
+        self.recipient = get_user(dm_dict['recipient'])
+        self._extra = _extra_fields(dm_dict, self._known)
+
+    def __getstate__(self):
+        return _slot_state(self)
+
+    def __setstate__(self, state):
+        _set_slot_state(self, state)
+
+    @property
+    def dm_dict(self):
+        """The direct message's dict as Twitter sent it
+        Built on request, so don't hang on to it
+        """
+        dm_dict = _rebuild_dict(self, self._fields)
+        dm_dict['sender'] = self.sender.user_dict
+        dm_dict['recipient'] = self.recipient.user_dict
+        return dm_dict
 
     def destroy(self):
         """Destroys the direct message from Twitter, not the python object
@@ -756,26 +1454,35 @@ class DirectMessagePaginated(Paginated):
     """Class to handle the timeline from Direct Messages
     """
 
-    def __init__(self, method, opener):
+    def __init__(self, method, transport):
         """
         
         Arguments:
         - `method`: Twitter method to use (ie: 'direct_messages/sent')
-        - `opener`: OpenDirector object from Twitter class
+        - `transport`: transport.Transport object from Twitter class
         """
-        Paginated.__init__(self, method, opener)
+        Paginated.__init__(self, method, transport)
 
     def to_status(self, data):
+        instr = self._transport.instrumentation
+        if instr != None:
+            data = instr.build(self._transport.endpoint(self._url), data, DirectMessage)
+            for x in data:
+                yield x
+            return
         for x in data:
             yield DirectMessage(x)
 
 
 
 if __name__ == '__main__':
-    twit = Twitter('imagemage', 'pooppoop')
-    # tline = twit.friends_timeline()
-    # data = tline.next_tweets()
-    # for x in data:
-    #     print x
-    data = twit.direct_messages()
-    print data
+    # Quick look at the API against a local fake Twitter, no account needed
+    from fakeserver import FakeTwitter
+    fake = FakeTwitter()
+    twit = Twitter('berd', 'berd', base_url=fake.start())
+    tline = twit.friends_timeline()
+    for x in tline.next_tweets():
+        print x
+    for x in twit.direct_messages().next_tweets():
+        print x
+    fake.stop()
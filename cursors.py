@@ -0,0 +1,143 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from fileutil import write_atomic
+
+
+class CursorStore(object):
+    """Remembers where each Paginated left off (its since_id and page) so a
+    restarted poller only asks for tweets it hasn't seen
+
+    Everything is loaded into memory up front. Saves are batched: they're
+    written out every batch_size saves or flush_interval seconds, whichever
+    comes first, and on flush()/close()
+    """
+
+    def __init__(self, batch_size=100, flush_interval=5.0):
+        """
+
+        Arguments:
+        - `batch_size`: Write out after this many saves
+        - `flush_interval`: Write out when the oldest unwritten save is this many seconds old
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._cursors = {}
+        self._dirty = {}
+        self._first_dirty = None
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """Returns the saved state dict for key (last_id and page), or None
+        """
+        state = self._cursors.get(key)
+        if state == None:
+            return None
+        return dict(state)
+
+    def save(self, key, state):
+        """Records the state dict for key. Written out in the next batch
+        """
+        self._lock.acquire()
+        try:
+            self._cursors[key] = state
+            self._dirty[key] = state
+            if self._first_dirty == None:
+                self._first_dirty = time.time()
+            due = (len(self._dirty) >= self.batch_size or
+                   time.time() - self._first_dirty >= self.flush_interval)
+        finally:
+            self._lock.release()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes out every save that hasn't been written yet
+        """
+        self._lock.acquire()
+        try:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            self._first_dirty = None
+            self._write(dirty)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self.flush()
+
+    def _write(self, dirty):
+        """Writes the dirty {key: state} entries. Called with the lock held
+        """
+        raise NotImplementedError
+
+
+class FileCursorStore(CursorStore):
+    """Keeps every cursor in one JSON file
+
+    The file is rewritten to a temp file and renamed over the old one, so
+    it's never left half written
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=5.0):
+        CursorStore.__init__(self, batch_size, flush_interval)
+        self.path = path
+        if os.path.exists(path):
+            fp = open(path, 'rb')
+            try:
+                self._cursors = json.load(fp)
+            finally:
+                fp.close()
+
+    def _write(self, dirty):
+        write_atomic(self.path, lambda fp: json.dump(self._cursors, fp),
+                     '.cursors', True)
+
+
+class SQLiteCursorStore(CursorStore):
+    """Keeps cursors in a SQLite table, one row per key. Only the rows that
+    changed are written, in one transaction per batch
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=5.0):
+        CursorStore.__init__(self, batch_size, flush_interval)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS cursors '
+                         '(key TEXT PRIMARY KEY, last_id INTEGER, page INTEGER)')
+        self._db.commit()
+        for key, last_id, page in self._db.execute('SELECT key, last_id, page FROM cursors'):
+            self._cursors[key] = {'last_id': last_id, 'page': page}
+
+    def _write(self, dirty):
+        rows = [(key, state.get('last_id'), state.get('page'))
+                for key, state in dirty.iteritems()]
+        self._db.executemany('INSERT OR REPLACE INTO cursors (key, last_id, page) '
+                             'VALUES (?, ?, ?)', rows)
+        self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
@@ -0,0 +1,519 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import BaseHTTPServer
+import hashlib
+import json
+import random
+import re
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+
+CREATED_AT = 'Sat Oct 17 20:15:00 +0000 2009'
+
+# The token in an OAuth Authorization header
+_oauth_token = re.compile(r'oauth_token="([^"]*)"')
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def close_connections(self):
+        # Keep-alive connections would otherwise leave handler threads
+        # blocked in readline after shutdown
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Hands every request to the FakeTwitter that owns the server
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one write, so Nagle's algorithm and delayed
+    # ACKs don't add 40ms to every keep-alive response
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        self.server.connections.discard(self.connection)
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        code, headers, body = self.server.fake.handle(self.command, self.path, self.headers)
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+    do_DELETE = do_GET
+
+
+class FakeTwitter(object):
+    """A local stand-in for the parts of the Twitter REST API that berd uses,
+    for benchmarks and trying things out without touching the real API
+
+    Timelines are made up on the fly from a fixed run of status ids (newest
+    first) and honour count, page, since_id and max_id. Latency, payload
+    size, rate limits and errors can all be dialed in, and the server keeps
+    count of what it served
+
+    Usage:
+        fake = FakeTwitter(latency=0.05)
+        twitter = berd.Twitter('user', 'pass', base_url=fake.start())
+        ...
+        fake.stop()
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, statuses=5000, text_size=60,
+                 users=200, ids=5000, rate_limit=None, window=3600,
+                 error_rate=0.0, error_codes=(500, 502, 503), seed=None,
+                 host='127.0.0.1', port=0, verbose=False):
+        """
+
+        Arguments:
+        - `latency`: Seconds to wait before answering each request
+        - `jitter`: Up to this many extra seconds, picked at random per request
+        - `statuses`: How many statuses exist. Status ids run from this down to 1
+        - `text_size`: Characters in each status text, to grow or shrink payloads
+        - `users`: How many distinct users the statuses are spread over
+        - `ids`: Entries in friends/ids, followers/ids and blocks/blocking/ids
+        - `rate_limit`: Calls per window per credential, None for no limit
+        - `window`: Length of a rate limit window in seconds
+        - `error_rate`: Fraction of requests (0 to 1) answered with an error instead
+        - `error_codes`: Status codes injected errors are picked from
+        - `seed`: Seed for the random latency and error injection
+        - `host`, `port`: Where to listen. Port 0 picks a free one
+        - `verbose`: Log every request to stderr
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.statuses = statuses
+        self.text_size = text_size
+        self.users = users
+        self.ids = ids
+        self.rate_limit = rate_limit
+        self.window = window
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._quota = {}
+        self._fail_next = []
+        self._status_json = {}
+        self._favorites = set()
+        self._blocks = set()
+        self._friends = set()
+        self._server = None
+        self._thread = None
+        self._routes = [(re.compile('^' + pattern + r'\.json$'), getattr(self, name))
+                        for pattern, name in self._route_table]
+        self.reset_stats()
+
+    _route_table = [
+        (r'account/verify_credentials', '_verify_credentials'),
+        (r'account/rate_limit_status', '_rate_limit_status'),
+        (r'statuses/(?:friends|public|home)_timeline', '_timeline'),
+        (r'statuses/mentions', '_timeline'),
+        (r'statuses/user_timeline(?:/(?P<id>\w+))?', '_timeline'),
+        (r'statuses/show/(?P<id>\d+)', '_show_status'),
+        (r'statuses/update', '_update_status'),
+        (r'statuses/destroy/(?P<id>\d+)', '_show_status'),
+        (r'direct_messages(?:/sent)?', '_direct_messages'),
+        (r'direct_messages/new', '_new_direct_message'),
+        (r'direct_messages/destroy/(?P<id>\d+)', '_destroy_direct_message'),
+        (r'friendships/(?P<action>create|destroy)/(?P<id>\w+)', '_friendship'),
+        (r'friendships/show', '_friendship_show'),
+        (r'(?:friends|followers)/ids', '_ids'),
+        (r'blocks/blocking/ids', '_ids'),
+        (r'blocks/blocking', '_block_list'),
+        (r'blocks/(?P<action>create|destroy|exists)/(?P<id>\w+)', '_block'),
+        (r'favorites/(?P<action>create|destroy)/(?P<id>\d+)', '_favorite'),
+        (r'favorites(?:/(?P<id>\w+))?', '_timeline'),
+        (r'notifications/(?:follow|leave)/(?P<id>\w+)', '_user_by_id'),
+        (r'users/lookup', '_users_lookup'),
+    ]
+
+    def start(self):
+        """Starts serving on a background thread and returns the base url to
+        hand to berd.Twitter
+        """
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.fake = self
+        self._server.connections = set()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server != None:
+            self._server.shutdown()
+            self._server.close_connections()
+            # Give the handler threads a moment to see their sockets close
+            give_up = time.time() + 1
+            while self._server.connections and time.time() < give_up:
+                time.sleep(0.01)
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return 'http://%s:%d/' % (host, port)
+
+    def fail_next(self, count=1, code=503):
+        """Answers the next count requests with code, whatever error_rate is
+        """
+        self._lock.acquire()
+        try:
+            self._fail_next.extend([code] * count)
+        finally:
+            self._lock.release()
+
+    def _count(self, name, amount=1):
+        self._lock.acquire()
+        try:
+            self._stats[name] += amount
+        finally:
+            self._lock.release()
+
+    def reset_stats(self):
+        self._stats = {'requests': 0, 'errors': 0, 'rate_limited': 0,
+                       'not_modified': 0, 'bytes': 0}
+
+    def stats(self):
+        """Returns a dict of how many requests came in, how many got injected
+        errors or were over the rate limit, and bytes of body sent
+        """
+        return dict(self._stats)
+
+    # Generated data
+
+    def user(self, user_id):
+        """The user dict for user_id
+        """
+        user_id = int(user_id)
+        return {'id': user_id, 'name': 'User %d' % user_id,
+                'screen_name': 'user%d' % user_id, 'url': 'http://example.com/',
+                'profile_image_url': 'http://a1.twimg.com/profile_images/%d/a.png' % user_id,
+                'description': u'Just a user\u2019s description', 'location': 'Earth',
+                'followers_count': 120, 'friends_count': 80, 'statuses_count': 3000,
+                'created_at': CREATED_AT, 'protected': False, 'utc_offset': -18000,
+                'time_zone': 'Eastern Time (US & Canada)', 'favourites_count': 3,
+                'notifications': False, 'following': user_id in self._friends,
+                'verified': False}
+
+    def status(self, status_id):
+        """The status dict for status_id
+        """
+        status_id = int(status_id)
+        text = u'Status %d, it\u2019s a tweet ' % status_id
+        text = (text * (self.text_size / len(text) + 1))[:self.text_size]
+        return {'id': status_id, 'text': text, 'created_at': CREATED_AT,
+                'source': 'web', 'favorited': status_id in self._favorites,
+                'truncated': False, 'in_reply_to_status_id': None,
+                'in_reply_to_screen_name': None, 'in_reply_to_user_id': None,
+                'user': self.user(1000 + status_id % self.users)}
+
+    def direct_message(self, dm_id):
+        dm_id = int(dm_id)
+        sender = self.user(1000 + dm_id % self.users)
+        recipient = self.user(1)
+        return {'id': dm_id, 'text': 'Direct message %d' % dm_id,
+                'created_at': CREATED_AT, 'sender_id': sender['id'],
+                'sender_screen_name': sender['screen_name'], 'sender': sender,
+                'recipient_id': recipient['id'],
+                'recipient_screen_name': recipient['screen_name'],
+                'recipient': recipient}
+
+    def _status_list(self, ids):
+        # Timelines are most of the traffic, so each status is serialized once
+        # and the list spliced together from the cached strings. favorited
+        # can change, so favorited ones aren't cached
+        parts = []
+        cache = self._status_json
+        for x in ids:
+            if x in self._favorites:
+                parts.append(json.dumps(self.status(x)))
+                continue
+            body = cache.get(x)
+            if body == None:
+                body = cache[x] = json.dumps(self.status(x))
+            parts.append(body)
+        return '[' + ','.join(parts) + ']'
+
+    def _timeline_ids(self, query, newest=None):
+        count = min(int(query.get('count', 20)), 200)
+        page = max(int(query.get('page', 1)), 1)
+        top = self.statuses
+        if newest != None:
+            top = min(top, newest)
+        if 'max_id' in query:
+            top = min(top, int(query['max_id']))
+        bottom = int(query.get('since_id', 0))
+        first = top - (page - 1) * count
+        return range(first, max(first - count, bottom), -1)
+
+    # Endpoints. Each gets (query, match groups plus the credential) and
+    # returns a body that's either a string of JSON or something to
+    # json.dumps, or a (status code, body) tuple
+
+    def _verify_credentials(self, query, groups):
+        return self.user(1)
+
+    def _rate_limit_status(self, query, groups):
+        if self.rate_limit == None:
+            return {'hourly_limit': 20000, 'remaining_hits': 20000,
+                    'reset_time_in_seconds': int(time.time() + self.window)}
+        allowed, remaining, reset = self._take_quota(groups['credential'], 0)
+        return {'hourly_limit': self.rate_limit, 'remaining_hits': remaining,
+                'reset_time_in_seconds': int(reset)}
+
+    def _timeline(self, query, groups):
+        return self._status_list(self._timeline_ids(query))
+
+    def _show_status(self, query, groups):
+        return self.status(groups['id'])
+
+    def _update_status(self, query, groups):
+        status = self.status(self.statuses + 1)
+        status['text'] = query.get('status', '')
+        return status
+
+    def _direct_messages(self, query, groups):
+        return [self.direct_message(x) for x in self._timeline_ids(query)]
+
+    def _new_direct_message(self, query, groups):
+        return self.direct_message(self.statuses + 1)
+
+    def _destroy_direct_message(self, query, groups):
+        return self.direct_message(groups['id'])
+
+    def _user_by_id(self, query, groups):
+        return self.user(self._user_id(groups['id']))
+
+    def _user_id(self, id):
+        # Takes an id or a user1234 style screen name
+        id = str(id)
+        if id.startswith('user'):
+            id = id[len('user'):]
+        if id.isdigit():
+            return int(id)
+        return 1
+
+    def _friendship(self, query, groups):
+        user_id = self._user_id(groups['id'])
+        if groups['action'] == 'create':
+            self._friends.add(user_id)
+        else:
+            self._friends.discard(user_id)
+        return self.user(user_id)
+
+    def _friendship_show(self, query, groups):
+        target = query.get('target_id') or query.get('target_screen_name', '1')
+        target = self._user_id(target)
+        return {'relationship': {
+            'source': {'id': 1, 'screen_name': 'user1', 'following': target in self._friends,
+                       'followed_by': target % 2 == 0, 'notifications_enabled': False},
+            'target': {'id': target, 'screen_name': 'user%d' % target,
+                       'following': target % 2 == 0, 'followed_by': target in self._friends,
+                       'notifications_enabled': False}}}
+
+    def _ids(self, query, groups):
+        if 'cursor' not in query:
+            return range(1, self.ids + 1)
+        cursor = int(query['cursor'])
+        start = 0
+        if cursor > 0:
+            start = cursor
+        end = min(start + 5000, self.ids)
+        next_cursor = 0
+        if end < self.ids:
+            next_cursor = end
+        return {'ids': range(start + 1, end + 1), 'next_cursor': next_cursor,
+                'previous_cursor': -start or 0}
+
+    def _block_list(self, query, groups):
+        page = max(int(query.get('page', 1)), 1)
+        first = (page - 1) * 20 + 1
+        return [self.user(x) for x in range(first, min(first + 20, self.ids + 1))]
+
+    def _block(self, query, groups):
+        user_id = self._user_id(groups['id'])
+        action = groups['action']
+        if action == 'create':
+            self._blocks.add(user_id)
+        elif action == 'destroy':
+            self._blocks.discard(user_id)
+        elif user_id not in self._blocks:
+            return 404, {'error': 'You are not blocking this user.'}
+        return self.user(user_id)
+
+    def _favorite(self, query, groups):
+        status_id = int(groups['id'])
+        if groups['action'] == 'create':
+            self._favorites.add(status_id)
+        else:
+            self._favorites.discard(status_id)
+        return self.status(status_id)
+
+    def _users_lookup(self, query, groups):
+        ids = [x for x in query.get('user_id', '').split(',') if x]
+        if len(ids) > 100:
+            return 403, {'error': 'Too many terms specified in query.'}
+        if not ids:
+            return 404, {'error': 'No user matches for specified terms'}
+        return [self.user(x) for x in ids]
+
+    # Request handling
+
+    def _credential(self, authorization):
+        # Who a request is from. An OAuth header is different every time
+        # (timestamp, nonce, signature), so it's the token that counts
+        if authorization.startswith('OAuth '):
+            match = _oauth_token.search(authorization)
+            if match != None:
+                return 'oauth:' + match.group(1)
+        return authorization
+
+    def _take_quota(self, credential, cost=1):
+        # Returns (allowed, remaining, reset time) for credential
+        now = time.time()
+        self._lock.acquire()
+        try:
+            used, reset = self._quota.get(credential, (0, now + self.window))
+            if now >= reset:
+                used, reset = 0, now + self.window
+            used += cost
+            self._quota[credential] = (used, reset)
+        finally:
+            self._lock.release()
+        return used <= self.rate_limit, max(self.rate_limit - used, 0), reset
+
+    def _injected_error(self):
+        self._lock.acquire()
+        try:
+            if self._fail_next:
+                return self._fail_next.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self._random.choice(self.error_codes)
+            return None
+        finally:
+            self._lock.release()
+
+    def handle(self, command, path, headers):
+        """Answers one request. Returns (status code, [(header, value)], body)
+        """
+        self._count('requests')
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+
+        # Not urlparse: berd asks for some methods with a leading slash, and
+        # urlparse would take '//statuses/...' for a host
+        request_path, x, query = path.partition('?')
+        query = dict(urlparse.parse_qsl(query))
+        response_headers = []
+
+        credential = self._credential(headers.getheader('Authorization', ''))
+        if self.rate_limit != None and not request_path.endswith('rate_limit_status.json'):
+            allowed, remaining, reset = self._take_quota(credential)
+            response_headers.extend([('X-RateLimit-Limit', str(self.rate_limit)),
+                                     ('X-RateLimit-Remaining', str(remaining)),
+                                     ('X-RateLimit-Reset', str(int(reset)))])
+            if not allowed:
+                self._count('rate_limited')
+                return 400, response_headers, json.dumps(
+                    {'error': 'Rate limit exceeded. Clients may not make more than %d requests per hour.'
+                     % self.rate_limit, 'request': request_path})
+
+        code = self._injected_error()
+        if code != None:
+            self._count('errors')
+            return code, response_headers, json.dumps({'error': 'Injected error', 'request': request_path})
+
+        path = re.sub('/+', '/', request_path).lstrip('/')
+        for pattern, endpoint in self._routes:
+            match = pattern.match(path)
+            if match != None:
+                break
+        else:
+            return 404, response_headers, json.dumps({'error': 'Not found', 'request': request_path})
+
+        code = 200
+        groups = match.groupdict()
+        groups['credential'] = credential
+        body = endpoint(query, groups)
+        if isinstance(body, tuple):
+            code, body = body
+        if not isinstance(body, str):
+            body = json.dumps(body)
+
+        if code == 200 and command == 'GET':
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            response_headers.append(('ETag', etag))
+            if headers.getheader('If-None-Match') == etag:
+                self._count('not_modified')
+                return 304, response_headers, ''
+        self._count('bytes', len(body))
+        return code, response_headers, body
+
+
+if __name__ == '__main__':
+    import optparse
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-p', '--port', type='int', default=8099)
+    parser.add_option('-l', '--latency', type='float', default=0.0)
+    parser.add_option('-r', '--rate-limit', type='int', default=None)
+    parser.add_option('-e', '--error-rate', type='float', default=0.0)
+    parser.add_option('-s', '--text-size', type='int', default=60)
+    options, args = parser.parse_args()
+    fake = FakeTwitter(latency=options.latency, rate_limit=options.rate_limit,
+                       error_rate=options.error_rate, text_size=options.text_size,
+                       port=options.port, verbose=True)
+    print 'Serving a fake Twitter API at', fake.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,48 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+
+
+def write_atomic(path, write, prefix='.tmp', sync=False):
+    """Writes a file through a temp file in the same directory and a rename,
+    so path is never left half written. The temp file is removed if
+    anything goes wrong
+
+    Arguments:
+    - `path`: File to write
+    - `write`: Called with the open temp file (binary mode) to fill it in
+    - `prefix`: Start of the temp file's name
+    - `sync`: fsync the temp file before it's renamed into place
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, dir=directory)
+    try:
+        fp = os.fdopen(fd, 'wb')
+        try:
+            write(fp)
+            if sync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        finally:
+            fp.close()
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
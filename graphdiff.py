@@ -0,0 +1,143 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import threading
+
+from idset import IdSet
+
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+
+class GraphEvent(object):
+    """Someone started or stopped following (or being followed by) an account
+    """
+    __slots__ = ('kind', 'account', 'user_id', 'user')
+
+    def __init__(self, kind, account, user_id, user=None):
+        """
+
+        Arguments:
+        - `kind`: FOLLOW or UNFOLLOW
+        - `account`: Key of the account the change is for
+        - `user_id`: ID of the user who followed/unfollowed
+        - `user`: berd.User for user_id, if it could be hydrated
+        """
+        self.kind = kind
+        self.account = account
+        self.user_id = user_id
+        self.user = user
+
+    def __repr__(self):
+        return 'GraphEvent(%r, %r, %r)' % (self.kind, self.account, self.user_id)
+
+
+class GraphTracker(object):
+    """Watches an account's followers (or friends) and reports who came and went
+
+    The last snapshot of each account is kept as an IdSet, in memory and on
+    disk (8 bytes an id), so a restart picks up where it left off. Each
+    refresh diffs the new ids against the snapshot, and only the ids that
+    changed are hydrated into User objects and handed to listeners
+    """
+
+    def __init__(self, twitter, directory, kind='followers', hydrate=True):
+        """
+
+        Arguments:
+        - `twitter`: berd.Twitter object to fetch ids (and hydrate users) with
+        - `directory`: Where snapshots are kept, one file per account
+        - `kind`: 'followers' or 'friends'
+        - `hydrate`: Turn changed ids into User objects on the events
+        """
+        if kind not in ('followers', 'friends'):
+            raise ValueError('kind must be followers or friends, not %r' % kind)
+        self.twitter = twitter
+        self.directory = directory
+        self.kind = kind
+        self.hydrate = hydrate
+        self._snapshots = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def add_listener(self, callback):
+        """Calls callback(event) with every GraphEvent from now on
+        """
+        self._listeners.append(callback)
+
+    def _path(self, account):
+        return os.path.join(self.directory, '%s-%s.ids' % (self.kind, account))
+
+    def snapshot(self, account):
+        """Returns the last IdSet seen for account, or None if it's never been refreshed
+        """
+        snapshot = self._snapshots.get(account)
+        if snapshot == None:
+            path = self._path(account)
+            if os.path.exists(path):
+                snapshot = IdSet.load(path)
+                self._snapshots[account] = snapshot
+        return snapshot
+
+    def _fetch(self, user_id):
+        if self.kind == 'followers':
+            return self.twitter.follower_id_set(user_id)
+        return self.twitter.friend_id_set(user_id)
+
+    def refresh(self, user_id=None):
+        """Fetches the current ids, diffs them against the last snapshot and
+        returns (and sends to the listeners) a list of GraphEvents
+        The first refresh of an account just takes the snapshot
+
+        Arguments:
+        - `user_id`: Account to refresh, None for the Authenticated user
+        """
+        account = user_id
+        if account == None:
+            account = 'self'
+        current = self._fetch(user_id)
+
+        self._lock.acquire()
+        try:
+            previous = self.snapshot(account)
+            self._snapshots[account] = current
+        finally:
+            self._lock.release()
+        if previous == current:
+            return []
+        current.save(self._path(account))
+        if previous == None:
+            return []
+
+        added = current - previous
+        removed = previous - current
+        users = {}
+        if self.hydrate and (len(added) or len(removed)):
+            changed = list(added) + list(removed)
+            for user in self.twitter.hydrate_users(changed):
+                users[user.id] = user
+
+        events = [GraphEvent(FOLLOW, account, x, users.get(x)) for x in added]
+        events.extend([GraphEvent(UNFOLLOW, account, x, users.get(x)) for x in removed])
+        for event in events:
+            for callback in self._listeners:
+                callback(event)
+        return events
@@ -0,0 +1,225 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import json
+import os
+import threading
+
+from fileutil import write_atomic
+
+
+class ResponseCache(object):
+    """Stores response bodies along with their ETag/Last-Modified validators
+    so a Transport can send conditional requests and answer 304s itself
+
+    Subclasses implement get, put and delete. Entries are
+    (etag, last_modified, body) tuples; either validator may be None
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """-> (etag, last_modified, body) or None"""
+        raise NotImplementedError
+
+    def put(self, key, etag, last_modified, body):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def record_hit(self, nbytes):
+        """A 304 was answered from the cache, saving nbytes of download
+        """
+        self._stats_lock.acquire()
+        try:
+            self.hits += 1
+            self.bytes_saved += nbytes
+        finally:
+            self._stats_lock.release()
+
+    def record_miss(self):
+        self._stats_lock.acquire()
+        try:
+            self.misses += 1
+        finally:
+            self._stats_lock.release()
+
+    def stats(self):
+        """Returns a dict with the hit, miss and bytes_saved counters
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'bytes_saved': self.bytes_saved}
+
+
+class MemoryCache(ResponseCache):
+    """In-memory cache that drops the least recently used bodies once they
+    add up to more than max_bytes
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        ResponseCache.__init__(self)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry != None:
+                self._entries[key] = entry
+            return entry
+        finally:
+            self._lock.release()
+
+    def put(self, key, etag, last_modified, body):
+        if len(body) > self.max_bytes:
+            self.delete(key)
+            return
+        self._lock.acquire()
+        try:
+            old = self._entries.pop(key, None)
+            if old != None:
+                self.size -= len(old[2])
+            self._entries[key] = (etag, last_modified, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                key, old = self._entries.popitem(last=False)
+                self.size -= len(old[2])
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            old = self._entries.pop(key, None)
+            if old != None:
+                self.size -= len(old[2])
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        stats = ResponseCache.stats(self)
+        stats.update({'entries': len(self._entries), 'size': self.size})
+        return stats
+
+
+class DiskCache(ResponseCache):
+    """Keeps one file per entry under directory, dropping the least recently
+    used files once they add up to more than max_bytes
+
+    Each file is a JSON line with the validators followed by the body.
+    Files are written to a temp file and renamed into place, so a crash
+    never leaves a half written entry
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        ResponseCache.__init__(self)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Rebuild the LRU order from modification times
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith('.') or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            files.append((st.st_mtime, name, st.st_size))
+        files.sort()
+        self._entries = collections.OrderedDict()
+        for mtime, name, size in files:
+            self._entries[name] = size
+            self.size += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            if key not in self._entries:
+                return None
+            self._entries[key] = self._entries.pop(key)
+        finally:
+            self._lock.release()
+        path = self._path(key)
+        try:
+            fp = open(path, 'rb')
+            try:
+                etag, last_modified = json.loads(fp.readline())
+                body = fp.read()
+            finally:
+                fp.close()
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            self.delete(key)
+            return None
+        return etag, last_modified, body
+
+    def put(self, key, etag, last_modified, body):
+        data = json.dumps([etag, last_modified]) + '\n' + body
+        if len(data) > self.max_bytes:
+            self.delete(key)
+            return
+        # Dot files are skipped when the directory is loaded again
+        write_atomic(self._path(key), lambda fp: fp.write(data), '.')
+
+        self._lock.acquire()
+        try:
+            self.size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self.size > self.max_bytes:
+                old_key, old_size = self._entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+        finally:
+            self._lock.release()
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self.size -= self._entries.pop(key, 0)
+        finally:
+            self._lock.release()
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        stats = ResponseCache.stats(self)
+        stats.update({'entries': len(self._entries), 'size': self.size})
+        return stats
@@ -0,0 +1,144 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import itertools
+import threading
+import time
+
+# Most ids users/lookup takes in one request
+LOOKUP_BATCH = 100
+
+
+class UserHydrator(object):
+    """Turns user ids into User objects using as few requests as it can
+
+    Ids are looked up LOOKUP_BATCH at a time, several batches at once, and
+    Users fetched within the last ttl seconds are handed back without
+    asking Twitter again. Ids Twitter didn't return are remembered for ttl
+    seconds too, so they aren't asked for over and over
+    """
+
+    def __init__(self, twitter, batch_size=LOOKUP_BATCH, workers=4,
+                 ttl=3600, max_size=100000):
+        """
+
+        Arguments:
+        - `twitter`: berd.Twitter object to make the users_lookup calls with
+        - `batch_size`: Ids per users_lookup request
+        - `workers`: Lookup requests in flight at once
+        - `ttl`: Seconds a fetched User counts as fresh
+        - `max_size`: Most Users to remember, least recently used go first
+        """
+        self.twitter = twitter
+        self.batch_size = batch_size
+        self.workers = workers
+        self.ttl = ttl
+        self.max_size = max_size
+        self.requests = 0
+        self._users = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, user_id, now):
+        entry = self._users.get(user_id)
+        return entry != None and now - entry[1] <= self.ttl
+
+    def _remember(self, batch, users, now):
+        found = dict([(user.id, user) for user in users])
+        self._lock.acquire()
+        try:
+            for user_id in batch:
+                self._users.pop(user_id, None)
+                self._users[user_id] = (found.get(user_id), now)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        finally:
+            self._lock.release()
+
+    def _lookup(self, batches):
+        """Looks up every batch of ids, up to workers at a time
+        Raises the first error any of them hit
+        """
+        errors = []
+        batches = list(batches)
+
+        def work():
+            while True:
+                self._lock.acquire()
+                try:
+                    if not batches or errors:
+                        return
+                    batch = batches.pop()
+                    self.requests += 1
+                finally:
+                    self._lock.release()
+                try:
+                    users = self.twitter.users_lookup(batch)
+                except Exception, e:
+                    errors.append(e)
+                    return
+                self._remember(batch, users, time.time())
+
+        threads = [threading.Thread(target=work)
+                   for x in range(min(self.workers, len(batches)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def hydrate(self, user_ids):
+        """Generator of User objects for user_ids, in the same order
+        Ids Twitter doesn't know are skipped
+
+        Arguments:
+        - `user_ids`: Iterable of User IDs
+        """
+        user_ids = iter(user_ids)
+        # Work through the ids a few batches at a time, so a long iterable
+        # starts yielding before all of it has been looked up
+        chunk = self.batch_size * self.workers
+        while True:
+            ids = list(itertools.islice(user_ids, chunk))
+            if not ids:
+                return
+            now = time.time()
+            missing = []
+            seen = set()
+            for user_id in ids:
+                if user_id not in seen and not self._is_fresh(user_id, now):
+                    missing.append(user_id)
+                seen.add(user_id)
+            batches = [missing[i:i + self.batch_size]
+                       for i in range(0, len(missing), self.batch_size)]
+            if batches:
+                self._lookup(batches)
+            for user_id in ids:
+                entry = self._users.get(user_id)
+                if entry != None and entry[0] != None:
+                    yield entry[0]
+
+    def clear(self):
+        """Forgets every fetched User
+        """
+        self._lock.acquire()
+        try:
+            self._users.clear()
+        finally:
+            self._lock.release()
@@ -0,0 +1,245 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+from array import array
+
+from fileutil import write_atomic
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 'q' isn't available to Python 2's array module, 'l' is 64 bits on the
+# LP64 platforms we run on
+TYPECODE = 'l'
+
+
+def _sorted_unique(ids):
+    if numpy != None:
+        if not isinstance(ids, numpy.ndarray):
+            ids = numpy.fromiter(ids, dtype=numpy.int64)
+        return numpy.unique(ids)
+    ids = array(TYPECODE, sorted(ids))
+    # Drop the duplicates in place, now they're next to each other
+    n = len(ids)
+    if n < 2:
+        return ids
+    write = 1
+    last = ids[0]
+    for read in xrange(1, n):
+        x = ids[read]
+        if x != last:
+            ids[write] = x
+            write += 1
+            last = x
+    del ids[write:]
+    return ids
+
+
+def _search(small, big, keep=True):
+    """Ids of sorted small that are (or with keep=False, aren't) in sorted big
+    """
+    found = array(TYPECODE)
+    lo = 0
+    n = len(big)
+    for x in small:
+        lo = bisect.bisect_left(big, x, lo)
+        if (lo < n and big[lo] == x) == keep:
+            found.append(x)
+    return found
+
+
+def _intersect(a, b):
+    """Ids in both sorted a and sorted b, walking them side by side
+    """
+    found = array(TYPECODE)
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na and j < nb:
+        x, y = a[i], b[j]
+        if x < y:
+            i += 1
+        elif x > y:
+            j += 1
+        else:
+            found.append(x)
+            i += 1
+            j += 1
+    return found
+
+
+def _difference(a, b):
+    """Ids in sorted a but not sorted b, walking them side by side
+    """
+    found = array(TYPECODE)
+    j = 0
+    nb = len(b)
+    for x in a:
+        while j < nb and b[j] < x:
+            j += 1
+        if j == nb or b[j] != x:
+            found.append(x)
+    return found
+
+
+def _union(a, b):
+    """Ids in either sorted a or sorted b, merged without re-sorting
+    """
+    found = array(TYPECODE)
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na and j < nb:
+        x, y = a[i], b[j]
+        if x < y:
+            found.append(x)
+            i += 1
+        elif x > y:
+            found.append(y)
+            j += 1
+        else:
+            found.append(x)
+            i += 1
+            j += 1
+    found.extend(a[i:])
+    found.extend(b[j:])
+    return found
+
+
+class IdSet(object):
+    """Set of user ids kept as one sorted buffer of 64 bit ints
+
+    Uses NumPy when it's installed, an array.array otherwise. Either way a
+    million ids take 8MB instead of the 30MB+ a set of ints would, and
+    intersection/difference/union run over the buffers without boxing every
+    id. IdSets are immutable
+    """
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids=()):
+        """
+
+        Arguments:
+        - `ids`: Iterable of user ids, in any order, duplicates allowed
+        """
+        self._ids = _sorted_unique(ids)
+
+    @classmethod
+    def _from_sorted(cls, ids):
+        idset = cls.__new__(cls)
+        idset._ids = ids
+        return idset
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        if numpy != None:
+            return iter(self._ids.tolist())
+        return iter(self._ids)
+
+    def __contains__(self, user_id):
+        ids = self._ids
+        if numpy != None:
+            i = numpy.searchsorted(ids, user_id)
+        else:
+            i = bisect.bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    def __eq__(self, other):
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        if numpy != None:
+            return numpy.array_equal(self._ids, other._ids)
+        return self._ids == other._ids
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return 'IdSet(%d ids)' % len(self)
+
+    @property
+    def nbytes(self):
+        """Bytes used by the id buffer
+        """
+        if numpy != None:
+            return self._ids.nbytes
+        return len(self._ids) * self._ids.itemsize
+
+    def tolist(self):
+        return list(self)
+
+    def save(self, path):
+        """Writes the ids to path as raw native 64 bit ints, 8 bytes an id
+        Goes through a temp file and a rename, so path is never half written
+        """
+        write_atomic(path, self._ids.tofile, '.idset')
+
+    @classmethod
+    def load(cls, path):
+        """Reads an IdSet written by save
+        """
+        if numpy != None:
+            return cls._from_sorted(numpy.fromfile(path, dtype=numpy.int64))
+        ids = array(TYPECODE)
+        fp = open(path, 'rb')
+        try:
+            ids.fromstring(fp.read())
+        finally:
+            fp.close()
+        return cls._from_sorted(ids)
+
+    def intersection(self, other):
+        """Ids in both sets, ie mutual follows out of friends and followers
+        """
+        a, b = self._ids, other._ids
+        if numpy != None:
+            return IdSet._from_sorted(numpy.intersect1d(a, b, assume_unique=True))
+        if len(a) > len(b):
+            a, b = b, a
+        if len(a) * 16 < len(b):
+            # Much smaller side: binary search for each of its ids
+            return IdSet._from_sorted(_search(a, b))
+        return IdSet._from_sorted(_intersect(a, b))
+
+    def difference(self, other):
+        """Ids in this set but not other, ie unfollowers as old - new
+        """
+        a, b = self._ids, other._ids
+        if numpy != None:
+            return IdSet._from_sorted(numpy.setdiff1d(a, b, assume_unique=True))
+        if len(a) * 16 < len(b):
+            return IdSet._from_sorted(_search(a, b, False))
+        return IdSet._from_sorted(_difference(a, b))
+
+    def union(self, other):
+        """Ids in either set
+        """
+        a, b = self._ids, other._ids
+        if numpy != None:
+            return IdSet._from_sorted(numpy.union1d(a, b))
+        return IdSet._from_sorted(_union(a, b))
+
+    __and__ = intersection
+    __sub__ = difference
+    __or__ = union
@@ -0,0 +1,279 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+
+clock = time.time
+
+# Phases a request's time is split into, besides the total
+PHASES = ('connect', 'ttfb', 'download', 'decode', 'build')
+
+
+class Histogram(object):
+    """Log-linear latency histogram, in the style of HdrHistogram
+
+    Values (microseconds) are bucketed with 2**sub_bits buckets per power of
+    two, so every recorded value is kept to within about 100/2**(sub_bits-1)
+    percent no matter how large it is, in a few hundred counters at most
+    """
+
+    def __init__(self, sub_bits=5):
+        """
+
+        Arguments:
+        - `sub_bits`: Precision. 5 keeps values to within about 6%
+        """
+        self._sub_bits = sub_bits
+        self._half = 1 << (sub_bits - 1)
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self._sub_bits
+        if shift <= 0:
+            return value
+        return shift * self._half + (value >> shift)
+
+    def _value(self, index):
+        # Midpoint of the bucket at index
+        shift = index // self._half - 1
+        if shift <= 0:
+            return index
+        return ((index - shift * self._half) << shift) + (1 << (shift - 1))
+
+    def record(self, value):
+        """Adds one value, in microseconds
+        """
+        value = int(value)
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """The value pct percent of recorded values are at or below
+        """
+        if not self.count:
+            return 0
+        wanted = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= wanted:
+                return max(self.min, min(self._value(index), self.max))
+        return self.max
+
+    def snapshot(self):
+        """Returns a dict of the count, mean, min, max and the usual percentiles
+        """
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': self.total / self.count,
+                'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99), 'p999': self.percentile(99.9)}
+
+
+class RequestTiming(object):
+    """What happened during one request. Times are in seconds, and are 0 for
+    phases that didn't happen (connect on a reused connection, say)
+
+    Pre hooks see it before the request is sent, post hooks once the
+    response has been decoded (or the request failed)
+    """
+    __slots__ = ('endpoint', 'method', 'url', 'started', 'elapsed', 'status',
+                 'reused', 'cached', 'bytes_in', 'bytes_out', 'error') + PHASES
+
+    def __init__(self, endpoint, method, url, bytes_out=0):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.started = clock()
+        self.elapsed = 0.0
+        self.status = None
+        self.reused = False
+        self.cached = False
+        self.bytes_in = 0
+        self.bytes_out = bytes_out
+        self.error = None
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.download = 0.0
+        self.decode = 0.0
+        self.build = 0.0
+
+
+class _EndpointStats(object):
+
+    def __init__(self, sub_bits):
+        self.requests = 0
+        self.errors = 0
+        self.cached = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.models = 0
+        self.latency = Histogram(sub_bits)
+        self.phases = dict([(x, Histogram(sub_bits)) for x in PHASES])
+
+    def snapshot(self):
+        phases = dict([(x, h.snapshot()) for x, h in self.phases.items()])
+        return {'requests': self.requests, 'errors': self.errors,
+                'cached': self.cached, 'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out, 'models': self.models,
+                'latency': self.latency.snapshot(), 'phases': phases}
+
+
+class Instrumentation(object):
+    """Collects per-endpoint timings, latency histograms and byte counts for
+    every request a Twitter object (and its Paginated objects) makes, and
+    calls any hooks registered before and after each request
+
+    Set it with Twitter.set_instrumentation. Nothing is measured while none
+    is set. All times in snapshot() are microseconds
+    """
+
+    def __init__(self, sub_bits=5):
+        """
+
+        Arguments:
+        - `sub_bits`: Histogram precision, see Histogram
+        """
+        self._sub_bits = sub_bits
+        self._pre_hooks = []
+        self._post_hooks = []
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def add_pre_hook(self, callback):
+        """Calls callback(timing) with a RequestTiming before each request is sent
+        """
+        self._pre_hooks.append(callback)
+
+    def add_post_hook(self, callback):
+        """Calls callback(timing) with the finished RequestTiming after each
+        request, successful or not
+        """
+        self._post_hooks.append(callback)
+
+    def _stats(self, endpoint):
+        # Called with the lock held
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats(self._sub_bits)
+        return stats
+
+    def begin(self, endpoint, method, url, bytes_out=0):
+        """Returns a RequestTiming for a request that's about to be sent
+        """
+        timing = RequestTiming(endpoint, method, url, bytes_out)
+        for callback in self._pre_hooks:
+            callback(timing)
+        return timing
+
+    def end(self, timing, error=None):
+        """Records a finished request
+
+        Arguments:
+        - `timing`: The RequestTiming from begin
+        - `error`: The exception the request failed with, if it did
+        """
+        timing.elapsed = clock() - timing.started
+        timing.error = error
+        self._lock.acquire()
+        try:
+            stats = self._stats(timing.endpoint)
+            stats.requests += 1
+            if error is not None:
+                stats.errors += 1
+            if timing.cached:
+                stats.cached += 1
+            stats.bytes_in += timing.bytes_in
+            stats.bytes_out += timing.bytes_out
+            stats.latency.record(timing.elapsed * 1000000)
+            phases = stats.phases
+            for name in ('connect', 'ttfb', 'download', 'decode'):
+                value = getattr(timing, name)
+                if value:
+                    phases[name].record(value * 1000000)
+        finally:
+            self._lock.release()
+        for callback in self._post_hooks:
+            callback(timing)
+
+    def record_build(self, endpoint, seconds, models):
+        """Records the time it took to turn one response into models
+        """
+        self._lock.acquire()
+        try:
+            stats = self._stats(endpoint)
+            stats.models += models
+            stats.phases['build'].record(seconds * 1000000)
+        finally:
+            self._lock.release()
+
+    def build(self, endpoint, data, factory):
+        """Yields factory(x) for x in data, timing only the factory calls.
+        The total is recorded against endpoint once data runs out (or the
+        generator is thrown away)
+        """
+        spent = 0.0
+        models = 0
+        try:
+            for x in data:
+                start = clock()
+                model = factory(x)
+                spent += clock() - start
+                models += 1
+                yield model
+        finally:
+            self.record_build(endpoint, spent, models)
+
+    def reset(self):
+        """Throws away everything recorded so far
+        """
+        self._lock.acquire()
+        try:
+            self._endpoints = {}
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """Returns a dict of everything recorded so far:
+        {'endpoints': {endpoint: {...}}, 'requests': n, 'errors': n,
+         'bytes_in': n, 'bytes_out': n}
+        """
+        self._lock.acquire()
+        try:
+            endpoints = dict([(name, stats.snapshot())
+                              for name, stats in self._endpoints.items()])
+        finally:
+            self._lock.release()
+        totals = {'endpoints': endpoints}
+        for name in ('requests', 'errors', 'bytes_in', 'bytes_out'):
+            totals[name] = sum([x[name] for x in endpoints.values()])
+        return totals
@@ -0,0 +1,167 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import re
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_scalar_end = re.compile(r'[ \t\n\r,\]]')
+# What _scan skips over inside a string, and outside one (whole strings
+# included, so it only stops at brackets or a string that's cut off)
+_string_body = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_plain = re.compile(r'(?:[^\[\]{}"]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+
+
+def _scan(s, i, depth, in_string, escape):
+    """Looks for the end of an object, array or string element that starts
+    (or carries on) in s, from i. depth, in_string and escape are where the
+    last call left off, so a big element can be scanned a chunk at a time
+
+    Returns (index just past the end or None, depth, in_string, escape)
+    """
+    n = len(s)
+    if escape:
+        i += 1
+    while True:
+        if in_string:
+            i = _string_body.match(s, i).end()
+            if i == n:
+                return None, depth, True, False
+            if s[i] == '\\':
+                # Only a backslash at the very end of s stops the match
+                return None, depth, True, True
+            in_string = False
+            i += 1
+            if depth == 0:
+                return i, 0, False, False
+        else:
+            if depth:
+                i = _plain.match(s, i).end()
+                if i == n:
+                    return None, depth, False, False
+            # else this is the element's opening { [ or "
+            char = s[i]
+            i += 1
+            if char == '"':
+                in_string = True
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return i, 0, False, False
+
+
+def iter_array(fp, chunk_size=8192):
+    """Generator that decodes a top-level JSON array from a file-like object
+    one element at a time, yielding each element as soon as it's complete
+
+    Only the element being decoded (plus one chunk) is held in memory. The
+    rest of the response is drained once the closing ] is seen, and fp is
+    closed if the generator is abandoned early
+
+    Arguments:
+    - `fp`: File-like object with a read(size) method
+    - `chunk_size`: Bytes to read at a time
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    # What comes next: '[' to open, 'first' value or ']', 'value' after a
+    # comma, 'sep' (',' or ']') after a value
+    expect = '['
+    try:
+        while True:
+            pos = _whitespace.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    raise ValueError('Unexpected end of JSON array')
+                chunk = fp.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+
+            char = buf[pos]
+            if expect == '[':
+                if char != '[':
+                    raise ValueError('Expected a JSON array, got %r' % char)
+                pos = pos + 1
+                expect = 'first'
+            elif expect == 'sep' or (expect == 'first' and char == ']'):
+                if char == ']':
+                    # Drain the rest so the connection can be reused
+                    fp.read()
+                    return
+                if char != ',':
+                    raise ValueError('Expected , or ] in JSON array, got %r' % char)
+                pos = pos + 1
+                expect = 'value'
+            elif char in '{["':
+                end, depth, in_string, escape = _scan(buf, pos, 0, False, False)
+                if end == None:
+                    # Runs past the buffer. Keep reading, scanning only the
+                    # new chunks, and decode once the whole element is here
+                    parts = [buf[pos:]]
+                    while end == None:
+                        chunk = fp.read(chunk_size)
+                        if not chunk:
+                            raise ValueError('Malformed JSON array element')
+                        end, depth, in_string, escape = _scan(chunk, 0, depth,
+                                                              in_string, escape)
+                        parts.append(chunk)
+                    chunk = parts.pop()
+                    parts.append(chunk[:end])
+                    obj = decoder.decode(''.join(parts))
+                    buf = chunk[end:]
+                    pos = 0
+                else:
+                    obj, pos = decoder.raw_decode(buf, pos)
+                expect = 'sep'
+                if pos > chunk_size:
+                    buf = buf[pos:]
+                    pos = 0
+                yield obj
+            else:
+                # A number could be cut off anywhere, so don't try one until
+                # whatever ends it is in the buffer too
+                if eof or _scalar_end.search(buf, pos):
+                    try:
+                        obj, end = decoder.raw_decode(buf, pos)
+                    except ValueError:
+                        end = None
+                else:
+                    end = None
+                if end == None:
+                    if eof:
+                        raise ValueError('Malformed JSON array element')
+                    chunk = fp.read(chunk_size)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                pos = end
+                expect = 'sep'
+                if pos > chunk_size:
+                    buf = buf[pos:]
+                    pos = 0
+                yield obj
+    finally:
+        if hasattr(fp, 'close'):
+            fp.close()
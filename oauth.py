@@ -23,19 +23,38 @@ THE SOFTWARE.
 """
 
 import cgi
+import multiprocessing
+import os
 import urllib
 import time
 import random
+import re
+import threading
 import urlparse
 import hmac
 import binascii
 
+try:
+    import hashlib # 2.5
+    _sha1 = hashlib.sha1
+except ImportError:
+    import sha as _sha1 # Deprecated
+
 
 VERSION = '1.0' # Hi Blaine!
 HTTP_METHOD = 'GET'
 SIGNATURE_METHOD = 'PLAINTEXT'
 
 
+# One key=value pair of an Authorization header, the value quoted or bare.
+# Commas inside quotes belong to the value.
+_header_param = re.compile(r'[\s,]*([^\s=,"]+)\s*=\s*(?:"([^"]*)"|([^\s,"]*))\s*(?:,|$)')
+_header_end = re.compile(r'[\s,]*$')
+# One key=value pair of a query string, at the start of a &/; separated
+# part. Parts without a value are skipped, as cgi.parse_qs does.
+_query_param = re.compile(r'(?:(?<=[&;])|^)([^&;=]*)=([^&;]+)')
+
+
 class OAuthError(RuntimeError):
     """Generic exception class."""
     def __init__(self, message='OAuth error occured.'):
@@ -56,6 +75,46 @@ def _utf8_str(s):
     else:
         return str(s)
 
+# Parameters that are the same on every request a client signs. Their
+# escaped, sorted pairs are cached per client instead of being escaped on
+# every request.
+STATIC_PARAMETERS = frozenset(['oauth_consumer_key', 'oauth_token',
+    'oauth_signature_method', 'oauth_version'])
+_static_runs = {}
+_MAX_STATIC_RUNS = 10000
+# Parameter names repeat across requests, so their escaped forms are kept.
+_escaped_keys = {}
+_MAX_ESCAPED_KEYS = 1000
+
+def _escape_key(k):
+    escaped = _escaped_keys.get(k)
+    if escaped is None:
+        if len(_escaped_keys) >= _MAX_ESCAPED_KEYS:
+            _escaped_keys.clear()
+        escaped = _escaped_keys[k] = escape(_utf8_str(k))
+    return escaped
+
+def _escape_pairs(pairs):
+    """Escape (key, value) pairs for the signature base string."""
+    return [(_escape_key(k), escape(_utf8_str(v))) for k, v in pairs]
+
+def _static_run(static):
+    """Escaped, sorted pairs for the static parameters, cached."""
+    static.sort()
+    static = tuple(static)
+    try:
+        run = _static_runs.get(static)
+    except TypeError:
+        # Unhashable value, just escape it.
+        return _escape_pairs(static)
+    if run is None:
+        if len(_static_runs) >= _MAX_STATIC_RUNS:
+            _static_runs.clear()
+        run = _escape_pairs(static)
+        run.sort()
+        _static_runs[static] = run
+    return run
+
 def generate_timestamp():
     """Get seconds since epoch (UTC)."""
     return int(time.time())
@@ -179,16 +238,18 @@ class OAuthRequest(object):
 
     def get_normalized_parameters(self):
         """Return a string that contains the parameters that must be signed."""
-        params = self.parameters
-        try:
-            # Exclude the signature if it exists.
-            del params['oauth_signature']
-        except:
-            pass
-        # Escape key values before sorting.
-        key_values = [(escape(_utf8_str(k)), escape(_utf8_str(v))) \
-            for k,v in params.items()]
-        # Sort lexicographically, first after key, then after value.
+        static = []
+        dynamic = []
+        for k, v in self.parameters.iteritems():
+            if k in STATIC_PARAMETERS:
+                static.append((k, v))
+            elif k != 'oauth_signature':
+                # The signature itself is left out.
+                dynamic.append((k, v))
+        # Escape key values before sorting. Sort lexicographically, first
+        # after key, then after value. The static run is already sorted,
+        # so sort() only has to sort the few per-request pairs and merge.
+        key_values = _static_run(static) + _escape_pairs(dynamic)
         key_values.sort()
         # Combine key value pairs into a string.
         return '&'.join(['%s=%s' % (k, v) for k, v in key_values])
@@ -247,9 +308,11 @@ class OAuthRequest(object):
             parameters.update(query_params)
 
         # URL parameters.
-        param_str = urlparse.urlparse(http_url)[4] # query
-        url_params = OAuthRequest._split_url_string(param_str)
-        parameters.update(url_params)
+        if '?' in http_url:
+            # The query, as urlparse would find it
+            param_str = http_url.split('#', 1)[0].partition('?')[2]
+            url_params = OAuthRequest._split_url_string(param_str)
+            parameters.update(url_params)
 
         if parameters:
             return OAuthRequest(http_method, http_url, parameters)
@@ -294,25 +357,38 @@ class OAuthRequest(object):
     def _split_header(header):
         """Turn Authorization: header into parameters."""
         params = {}
-        parts = header.split(',')
-        for param in parts:
+        pos = 0
+        match = _header_param.match(header)
+        while match is not None:
+            key, quoted, bare = match.groups()
             # Ignore realm parameter.
-            if param.find('realm') > -1:
-                continue
-            # Remove whitespace.
-            param = param.strip()
-            # Split key-value.
-            param_parts = param.split('=', 1)
-            # Remove quotes and unescape the value.
-            params[param_parts[0]] = urllib.unquote(param_parts[1].strip('\"'))
+            if key != 'realm':
+                if quoted is None:
+                    quoted = bare
+                if '%' in quoted:
+                    quoted = urllib.unquote(quoted)
+                params[key] = quoted
+            pos = match.end()
+            match = _header_param.match(header, pos)
+        if _header_end.match(header, pos) is None:
+            raise OAuthError('Unable to parse OAuth parameters from '
+                'Authorization header.')
         return params
     _split_header = staticmethod(_split_header)
 
     def _split_url_string(param_str):
         """Turn URL string into parameters."""
-        parameters = cgi.parse_qs(param_str, keep_blank_values=False)
-        for k, v in parameters.iteritems():
-            parameters[k] = urllib.unquote(v[0])
+        parameters = {}
+        unquote = urllib.unquote_plus
+        for match in _query_param.finditer(param_str):
+            key, value = match.groups()
+            if '%' in key or '+' in key:
+                key = unquote(key)
+            # The first value wins, and each is only unquoted once.
+            if key not in parameters:
+                if '%' in value or '+' in value:
+                    value = unquote(value)
+                parameters[key] = value
         return parameters
     _split_url_string = staticmethod(_split_url_string)
 
@@ -322,6 +398,8 @@ class OAuthServer(object):
     version = VERSION
     signature_methods = None
     data_store = None
+    _pool = None # verify_requests' process pool
+    _pool_processes = None
 
     def __init__(self, data_store=None, signature_methods=None):
         self.data_store = data_store
@@ -368,13 +446,144 @@ class OAuthServer(object):
     def verify_request(self, oauth_request):
         """Verifies an api call and checks all the parameters."""
         # -> consumer and token
+        consumer, token = self._resolve_request(oauth_request)
+        self._check_signature_value(oauth_request, consumer, token)
+        parameters = oauth_request.get_nonoauth_parameters()
+        return consumer, token, parameters
+
+    def verify_requests(self, oauth_requests, processes=None):
+        """Verifies a batch of api calls.
+
+        -> a list with, for each request in order, (consumer, token,
+        parameters) as verify_request would return or the error (normally
+        an OAuthError) it would raise. Everything but the signatures and
+        nonces is checked here; requests are then grouped by consumer, token
+        and signature method, and the groups' signatures are checked across
+        a pool of processes (one per CPU unless processes says otherwise,
+        and none for 1). Only correctly signed requests use up their nonces,
+        so one bad request can't spoil a retry of the others.
+        """
+        results = [None] * len(oauth_requests)
+        # (consumer key, token key, signature method) ->
+        #     [signature method, consumer, token, [(index, request, signature)]]
+        groups = {}
+        for index, oauth_request in enumerate(oauth_requests):
+            try:
+                consumer, token = self._resolve_request(oauth_request, False)
+                signature = oauth_request.parameters.get('oauth_signature')
+                if signature is None:
+                    raise OAuthError('Missing signature.')
+                name = oauth_request.parameters.get('oauth_signature_method',
+                    SIGNATURE_METHOD)
+                group_key = (consumer.key, token.key, name)
+                group = groups.get(group_key)
+                if group is None:
+                    group = groups[group_key] = [
+                        self._get_signature_method(oauth_request), consumer,
+                        token, []]
+            except Exception, e:
+                results[index] = e
+                continue
+            group[3].append((index, oauth_request, signature))
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        checked = sum([len(x[3]) for x in groups.itervalues()])
+        # Big groups are split up, so one busy token can't hold up the batch
+        chunk_size = max(1, -(-checked // (processes * 4)))
+        chunks = []
+        for signature_method, consumer, token, items in groups.itervalues():
+            for i in range(0, len(items), chunk_size):
+                chunks.append((signature_method, consumer, token,
+                    items[i:i + chunk_size]))
+        if processes > 1 and len(chunks) > 1:
+            checks = self._get_pool(processes).map(_check_signatures, chunks)
+        else:
+            checks = map(_check_signatures, chunks)
+
+        for chunk, bad in zip(chunks, checks):
+            signature_method, consumer, token, items = chunk
+            for index, oauth_request, signature in items:
+                base = bad.get(index)
+                if isinstance(base, Exception):
+                    results[index] = base
+                elif base is not None:
+                    results[index] = OAuthError('Invalid signature. Expected '
+                        'signature base string: %s' % base)
+                else:
+                    results[index] = (consumer, token, oauth_request)
+
+        # Nonces last, in request order
+        for index, result in enumerate(results):
+            if not isinstance(result, tuple):
+                continue
+            consumer, token, oauth_request = result
+            try:
+                self._check_nonce(consumer, token,
+                    oauth_request._get_timestamp_nonce()[1])
+                results[index] = (consumer, token,
+                    oauth_request.get_nonoauth_parameters())
+            except Exception, e:
+                results[index] = e
+        return results
+
+    def _get_pool(self, processes):
+        pool = self._pool
+        if pool is None or self._pool_processes != processes:
+            if pool is not None:
+                pool.terminate()
+            pool = self._pool = multiprocessing.Pool(processes)
+            self._pool_processes = processes
+        return pool
+
+    def close(self):
+        """Shut down the process pool verify_requests started, if any."""
+        pool = self._pool
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            self._pool = None
+
+    def _resolve_request(self, oauth_request, use_nonce=True):
+        """-> consumer, token once everything but the signature checks out.
+        With use_nonce=False the nonce is left for the caller to check."""
+        lookup_request = getattr(self.data_store, 'lookup_request', None)
+        if use_nonce and lookup_request is not None:
+            return self._resolve_request_combined(oauth_request, lookup_request)
         version = self._get_version(oauth_request)
         consumer = self._get_consumer(oauth_request)
         # Get the access token.
         token = self._get_token(oauth_request, 'access')
-        self._check_signature(oauth_request, consumer, token)
-        parameters = oauth_request.get_nonoauth_parameters()
-        return consumer, token, parameters
+        timestamp, nonce = oauth_request._get_timestamp_nonce()
+        self._check_timestamp(timestamp)
+        if use_nonce:
+            self._check_nonce(consumer, token, nonce)
+        return consumer, token
+
+    def _resolve_request_combined(self, oauth_request, lookup_request):
+        """_resolve_request for data stores with lookup_request, which finds
+        the consumer and token and checks the nonce in one call."""
+        params = oauth_request.parameters
+        version = params.get('oauth_version')
+        if version and version != self.version:
+            raise OAuthError('OAuth version %s not supported.' % str(version))
+        try:
+            consumer_key = params['oauth_consumer_key']
+            token_key = params['oauth_token']
+            timestamp = params['oauth_timestamp']
+            nonce = params['oauth_nonce']
+        except KeyError, e:
+            raise OAuthError('Parameter not found: %s' % e.args[0])
+        self._check_timestamp(timestamp)
+        consumer, token, nonce_used = lookup_request(consumer_key, 'access',
+            token_key, nonce)
+        if not consumer:
+            raise OAuthError('Invalid consumer.')
+        if not token:
+            raise OAuthError('Invalid access token: %s' % token_key)
+        if nonce_used:
+            raise OAuthError('Nonce already used: %s' % str(nonce))
+        return consumer, token
 
     def authorize_token(self, token, user):
         """Authorize a request token."""
@@ -434,6 +643,9 @@ class OAuthServer(object):
         timestamp, nonce = oauth_request._get_timestamp_nonce()
         self._check_timestamp(timestamp)
         self._check_nonce(consumer, token, nonce)
+        self._check_signature_value(oauth_request, consumer, token)
+
+    def _check_signature_value(self, oauth_request, consumer, token):
         signature_method = self._get_signature_method(oauth_request)
         try:
             signature = oauth_request.get_parameter('oauth_signature')
@@ -447,17 +659,25 @@ class OAuthServer(object):
                 oauth_request, consumer, token)
             raise OAuthError('Invalid signature. Expected signature base '
                 'string: %s' % base)
-        built = signature_method.build_signature(oauth_request, consumer, token)
 
     def _check_timestamp(self, timestamp):
         """Verify that timestamp is recentish."""
-        timestamp = int(timestamp)
+        try:
+            timestamp = int(timestamp)
+        except (TypeError, ValueError):
+            raise OAuthError('Invalid timestamp: %s' % timestamp)
         now = int(time.time())
         lapsed = now - timestamp
         if lapsed > self.timestamp_threshold:
             raise OAuthError('Expired timestamp: given %d and now %s has a '
                 'greater difference than threshold %d' %
                 (timestamp, now, self.timestamp_threshold))
+        # Nonces are only remembered for so long, so a request stamped far
+        # enough ahead could be replayed once its nonce was forgotten.
+        if -lapsed > self.timestamp_threshold:
+            raise OAuthError('Future timestamp: given %d and now %s has a '
+                'greater difference than threshold %d' %
+                (timestamp, now, self.timestamp_threshold))
 
     def _check_nonce(self, consumer, token, nonce):
         """Verify that the nonce is uniqueish."""
@@ -466,6 +686,45 @@ class OAuthServer(object):
             raise OAuthError('Nonce already used: %s' % str(nonce))
 
 
+def _check_signatures(chunk):
+    """Checks the signatures of requests that share a signature method,
+    consumer and token. Runs in OAuthServer.verify_requests' pool.
+
+    -> {index: expected signature base string, or the error checking it
+    raised} for the ones that are bad.
+    """
+    signature_method, consumer, token, items = chunk
+    bad = {}
+    if isinstance(signature_method, OAuthSignatureMethod_HMAC_SHA1):
+        # The whole chunk shares one signing context, and requests to the
+        # same url share the start of the base string
+        context = signature_method.get_context(consumer, token)
+        prefixes = {}
+        for index, oauth_request, signature in items:
+            try:
+                url = (oauth_request.http_method, oauth_request.http_url)
+                prefix = prefixes.get(url)
+                if prefix is None:
+                    prefix = prefixes[url] = '%s&%s&' % (
+                        escape(oauth_request.get_normalized_http_method()),
+                        escape(oauth_request.get_normalized_http_url()))
+                raw = prefix + escape(oauth_request.get_normalized_parameters())
+                if context.sign(raw) != signature:
+                    bad[index] = raw
+            except Exception, e:
+                bad[index] = e
+        return bad
+    for index, oauth_request, signature in items:
+        try:
+            if not signature_method.check_signature(oauth_request, consumer,
+                    token, signature):
+                bad[index] = signature_method.build_signature_base_string(
+                    oauth_request, consumer, token)[1]
+        except Exception, e:
+            bad[index] = e
+    return bad
+
+
 class OAuthClient(object):
     """OAuthClient is a worker to attempt to execute a request."""
     consumer = None
@@ -506,7 +765,8 @@ class OAuthDataStore(object):
         raise NotImplementedError
 
     def lookup_nonce(self, oauth_consumer, oauth_token, nonce):
-        """-> OAuthToken."""
+        """-> nonce if it was already used, else None. A nonce only needs
+        keeping for as long as OAuthServer.timestamp_threshold, see NonceCache."""
         raise NotImplementedError
 
     def fetch_request_token(self, oauth_consumer):
@@ -522,6 +782,215 @@ class OAuthDataStore(object):
         raise NotImplementedError
 
 
+class NonceCache(object):
+    """Replay cache for nonces, per (consumer key, token key).
+
+    Nonces go in a bucket for the window (window seconds long, normally
+    OAuthServer.timestamp_threshold) they arrived in, and only the current
+    bucket and the two before it are kept. OAuthServer takes timestamps
+    up to a window either side of now, so a request can be replayed for
+    up to two windows after it first arrives, and every nonce is kept for
+    at least that long. Memory is bounded by three windows of traffic.
+    Older buckets are dropped whole rather than purged entry by entry, and
+    a clock that steps backwards never drops any.
+
+    With bloom_bits, each bucket also gets a Bloom filter of that many bits
+    in front of its exact sets. A nonce the filters haven't seen is new
+    without looking at the sets; a filter hit falls back to them, so false
+    positives never reject a request. The sets are fast enough that the
+    filter costs more than it saves here, so it's off by default.
+    """
+    buckets = 3
+
+    def __init__(self, window=300, bloom_bits=None, bloom_hashes=4):
+        self.window = window
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self._index = None
+        # Newest first
+        self._buckets = [self._new_bucket()]
+        self._lock = threading.Lock()
+
+    def _new_bucket(self):
+        # ({(consumer key, token key): set of nonces}, bloom filter or None)
+        bloom = None
+        if self.bloom_bits:
+            bloom = bytearray((self.bloom_bits + 7) // 8)
+        return {}, bloom
+
+    def _rotate(self, now):
+        index = int(now // self.window)
+        if index == self._index:
+            return
+        if self._index is not None and index < self._index:
+            # The clock stepped back. Keep everything, new nonces just go
+            # in the current bucket until the clock catches up
+            return
+        if self._index is not None and 0 < index - self._index < self.buckets:
+            fresh = [self._new_bucket() for i in range(index - self._index)]
+            self._buckets = (fresh + self._buckets)[:self.buckets]
+        else:
+            self._buckets = [self._new_bucket()]
+        self._index = index
+
+    def _bits(self, key, nonce):
+        # Double hashing: bloom_hashes positions out of two hash values
+        h = hash((key, nonce))
+        h1 = h & 0xffffffff
+        h2 = ((h >> 32) & 0xffffffff) | 1
+        m = self.bloom_bits
+        return [(h1 + i * h2) % m for i in range(self.bloom_hashes)]
+
+    def use(self, consumer_key, token_key, nonce, now=None):
+        """-> True if nonce was already used by this consumer and token,
+        else False (and it's now used)."""
+        if now is None:
+            now = time.time()
+        key = (consumer_key, token_key)
+        self._lock.acquire()
+        try:
+            self._rotate(now)
+            if self.bloom_bits:
+                bits = self._bits(key, nonce)
+            for nonces, bloom in self._buckets:
+                if bloom is not None:
+                    for bit in bits:
+                        if not bloom[bit >> 3] & (1 << (bit & 7)):
+                            break
+                    else:
+                        if nonce in nonces.get(key, ()):
+                            return True
+                elif nonce in nonces.get(key, ()):
+                    return True
+            current, bloom = self._buckets[0]
+            if bloom is not None:
+                for bit in bits:
+                    bloom[bit >> 3] |= 1 << (bit & 7)
+            nonces = current.get(key)
+            if nonces is None:
+                nonces = current[key] = set()
+            nonces.add(nonce)
+            return False
+        finally:
+            self._lock.release()
+
+    def expire(self, now=None):
+        """Drop buckets that have aged out, without waiting for a nonce."""
+        if now is None:
+            now = time.time()
+        self._lock.acquire()
+        try:
+            self._rotate(now)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return sum([len(x) for bucket in self._buckets
+                    for x in bucket[0].itervalues()])
+
+
+class MemoryOAuthDataStore(OAuthDataStore):
+    """OAuthDataStore that keeps consumers, tokens and nonces in dicts.
+
+    Tokens can expire after a ttl. lookup_request finds the consumer and
+    token and checks the nonce in one call, which OAuthServer.verify_request
+    uses instead of three separate lookups.
+    """
+
+    def __init__(self, token_ttl=None, nonce_ttl=OAuthServer.timestamp_threshold,
+            bloom_bits=None):
+        self.token_ttl = token_ttl
+        self.nonce_ttl = nonce_ttl
+        self.consumers = {}
+        # token_type -> {token key: (token, expires or None)}
+        self.tokens = {'request': {}, 'access': {}}
+        self.nonces = NonceCache(nonce_ttl, bloom_bits)
+        self._next_purge = time.time() + nonce_ttl
+
+    def add_consumer(self, consumer):
+        self.consumers[consumer.key] = consumer
+        return consumer
+
+    def add_token(self, token, token_type='access', ttl=None):
+        """Store token, expiring after ttl (or token_ttl) seconds."""
+        if ttl is None:
+            ttl = self.token_ttl
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        self.tokens[token_type][token.key] = (token, expires)
+        return token
+
+    def remove_token(self, token, token_type='access'):
+        self.tokens[token_type].pop(token.key, None)
+
+    def lookup_consumer(self, key):
+        return self.consumers.get(key)
+
+    def lookup_token(self, token_type, token_token):
+        entry = self.tokens[token_type].get(token_token)
+        if entry is None:
+            return None
+        token, expires = entry
+        if expires is not None and expires < time.time():
+            del self.tokens[token_type][token_token]
+            return None
+        return token
+
+    def lookup_nonce(self, oauth_consumer, oauth_token, nonce):
+        """-> nonce if it was already used, else None (and it's now used)."""
+        if oauth_token:
+            token_key = oauth_token.key
+        else:
+            token_key = None
+        return self._use_nonce(oauth_consumer.key, token_key, nonce)
+
+    def _use_nonce(self, consumer_key, token_key, nonce):
+        now = time.time()
+        if now >= self._next_purge:
+            self.purge(now)
+        if self.nonces.use(consumer_key, token_key, nonce, now):
+            return nonce
+        return None
+
+    def lookup_request(self, consumer_key, token_type, token_key, nonce):
+        """-> (consumer, token, nonce_used). Consumer and token are None
+        if they aren't known; the nonce is only checked when both are."""
+        consumer = self.consumers.get(consumer_key)
+        if consumer is None:
+            return None, None, False
+        token = self.lookup_token(token_type, token_key)
+        if token is None:
+            return consumer, None, False
+        return consumer, token, self._use_nonce(consumer_key, token_key, nonce) is not None
+
+    def purge(self, now=None):
+        """Drop expired nonces and tokens."""
+        if now is None:
+            now = time.time()
+        self.nonces.expire(now)
+        for tokens in self.tokens.values():
+            for key, (token, expires) in tokens.items():
+                if expires is not None and expires < now:
+                    del tokens[key]
+        self._next_purge = now + self.nonce_ttl
+
+    def _new_token(self, token_type):
+        token = OAuthToken(binascii.hexlify(os.urandom(16)),
+            binascii.hexlify(os.urandom(16)))
+        return self.add_token(token, token_type)
+
+    def fetch_request_token(self, oauth_consumer):
+        return self._new_token('request')
+
+    def fetch_access_token(self, oauth_consumer, oauth_token):
+        self.remove_token(oauth_token, 'request')
+        return self._new_token('access')
+
+    def authorize_request_token(self, oauth_token, user):
+        return oauth_token
+
+
 class OAuthSignatureMethod(object):
     """A strategy class that implements a signature method."""
     def get_name(self):
@@ -541,39 +1010,81 @@ class OAuthSignatureMethod(object):
         return built == signature
 
 
+class OAuthSigningContext(object):
+    """Everything about a (consumer, token) pair that HMAC-SHA1 signing
+    needs and that doesn't change between requests: the escaped key and an
+    HMAC already keyed with it. Signing a request copies the keyed HMAC and
+    only hashes the base string.
+    """
+
+    def __init__(self, consumer, token=None):
+        self.consumer = consumer
+        self.token = token
+        key = '%s&' % escape(consumer.secret)
+        if token:
+            key += escape(token.secret)
+        self.key = key
+        self._hmac = hmac.new(key, None, _sha1)
+
+    def sign(self, raw):
+        """-> base 64 HMAC-SHA1 of the signature base string raw."""
+        hashed = self._hmac.copy()
+        hashed.update(raw)
+        return binascii.b2a_base64(hashed.digest())[:-1]
+
+    def build_signature(self, oauth_request):
+        return self.sign(_signature_base_string(oauth_request))
+
+
+def _signature_base_string(oauth_request):
+    return '&'.join((
+        escape(oauth_request.get_normalized_http_method()),
+        escape(oauth_request.get_normalized_http_url()),
+        escape(oauth_request.get_normalized_parameters()),
+    ))
+
+
 class OAuthSignatureMethod_HMAC_SHA1(OAuthSignatureMethod):
+    """Keeps a signing context per (consumer, token) pair, so the key is
+    only escaped and fed to the HMAC once per pair rather than per request.
+    """
+    max_contexts = 10000
+
+    def __init__(self):
+        self._contexts = {}
+
+    def __getstate__(self):
+        # Sent to verify_requests' pool without the cache
+        state = self.__dict__.copy()
+        state['_contexts'] = {}
+        return state
 
     def get_name(self):
         return 'HMAC-SHA1'
-        
-    def build_signature_base_string(self, oauth_request, consumer, token):
-        sig = (
-            escape(oauth_request.get_normalized_http_method()),
-            escape(oauth_request.get_normalized_http_url()),
-            escape(oauth_request.get_normalized_parameters()),
-        )
 
-        key = '%s&' % escape(consumer.secret)
+    def get_context(self, consumer, token=None):
+        """-> OAuthSigningContext for consumer and token, cached."""
+        # The secrets are part of the cache key, so a changed secret gets
+        # a new context rather than a stale one.
         if token:
-            key += escape(token.secret)
-        raw = '&'.join(sig)
-        return key, raw
+            cache_key = (consumer.key, consumer.secret, token.key, token.secret)
+        else:
+            cache_key = (consumer.key, consumer.secret, None, None)
+        context = self._contexts.get(cache_key)
+        if context is None:
+            if len(self._contexts) >= self.max_contexts:
+                self._contexts.clear()
+            context = OAuthSigningContext(consumer, token)
+            self._contexts[cache_key] = context
+        return context
+
+    def build_signature_base_string(self, oauth_request, consumer, token):
+        key = self.get_context(consumer, token).key
+        return key, _signature_base_string(oauth_request)
 
     def build_signature(self, oauth_request, consumer, token):
         """Builds the base signature string."""
-        key, raw = self.build_signature_base_string(oauth_request, consumer,
-            token)
-
-        # HMAC object.
-        try:
-            import hashlib # 2.5
-            hashed = hmac.new(key, raw, hashlib.sha1)
-        except:
-            import sha # Deprecated
-            hashed = hmac.new(key, raw, sha)
-
-        # Calculate the digest base 64.
-        return binascii.b2a_base64(hashed.digest())[:-1]
+        return self.get_context(consumer, token).build_signature(oauth_request)
 
 
 class OAuthSignatureMethod_PLAINTEXT(OAuthSignatureMethod):
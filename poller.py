@@ -0,0 +1,221 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import itertools
+import logging
+import Queue
+import threading
+import time
+
+_log = logging.getLogger('berd.poller')
+
+
+class _Feed(object):
+    """One Paginated being polled, with its own interval
+    """
+
+    def __init__(self, key, paginated, interval):
+        self.key = key
+        self.paginated = paginated
+        self.interval = interval
+        self.removed = False
+        self.polls = 0
+        self.errors = 0
+
+
+class Poller(object):
+    """Polls next_tweets on many Paginated objects (from any number of Twitter
+    accounts) using a fixed number of worker threads
+
+    Each feed has its own interval: it's polled sooner after it turns up new
+    tweets and backs off while it's quiet. Every batch of new tweets goes
+    onto one output queue as a (key, [Status, ...]) tuple
+    """
+
+    def __init__(self, workers=8, output=None, min_interval=30,
+                 max_interval=600, speedup=0.5, backoff=1.5, on_error=None):
+        """
+
+        Arguments:
+        - `workers`: Number of polling threads
+        - `output`: Queue.Queue that gets (key, statuses) tuples. A new one is made if None
+        - `min_interval`: Fewest seconds between polls of one feed
+        - `max_interval`: Most seconds between polls of one feed
+        - `speedup`: Interval is multiplied by this after a poll with new tweets
+        - `backoff`: Interval is multiplied by this after a poll with nothing new
+        - `on_error`: Called as on_error(key, exception) when a poll fails.
+                      Anything it raises is logged, and polling carries on
+        """
+        if output == None:
+            output = Queue.Queue()
+        self.output = output
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.backoff = backoff
+        self.on_error = on_error
+        self._feeds = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        # Bounded so the scheduler can't run far ahead of the workers
+        self._work = Queue.Queue(workers * 2)
+        self._threads = []
+        self._running = False
+
+    def add(self, key, paginated, interval=None):
+        """Starts polling paginated. Its first poll is due right away
+
+        Arguments:
+        - `key`: Anything hashable identifying the feed in the output
+        - `paginated`: berd.Paginated to call next_tweets on
+        - `interval`: Starting interval in seconds (defaults to min_interval)
+        """
+        if interval == None:
+            interval = self.min_interval
+        feed = _Feed(key, paginated, interval)
+        self._cond.acquire()
+        try:
+            old = self._feeds.get(key)
+            if old != None:
+                old.removed = True
+            self._feeds[key] = feed
+            self._push(feed, time.time())
+        finally:
+            self._cond.release()
+
+    def add_account(self, twitter, name):
+        """Polls an account's friends_timeline and mentions, keyed as
+        (name, 'friends_timeline') and (name, 'mentions')
+        """
+        self.add((name, 'friends_timeline'), twitter.friends_timeline())
+        self.add((name, 'mentions'), twitter.mentions())
+
+    def remove(self, key):
+        """Stops polling the feed for key
+        """
+        self._cond.acquire()
+        try:
+            feed = self._feeds.pop(key, None)
+            if feed != None:
+                feed.removed = True
+        finally:
+            self._cond.release()
+
+    def __len__(self):
+        return len(self._feeds)
+
+    def _push(self, feed, due):
+        # Called with the lock held
+        heapq.heappush(self._heap, (due, self._counter.next(), feed))
+        self._cond.notify()
+
+    def start(self):
+        """Starts the scheduler and worker threads
+        """
+        if self._running:
+            return
+        self._running = True
+        self._threads = [threading.Thread(target=self._schedule_loop)]
+        for x in range(self.workers):
+            self._threads.append(threading.Thread(target=self._work_loop))
+        for thread in self._threads:
+            thread.setDaemon(True)
+            thread.start()
+
+    def stop(self):
+        """Stops polling and waits for polls in progress to finish
+        """
+        self._cond.acquire()
+        try:
+            self._running = False
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+        if not self._threads:
+            # Never started
+            return
+        self._threads[0].join()
+        for x in range(self.workers):
+            self._work.put(None)
+        for thread in self._threads[1:]:
+            thread.join()
+        self._threads = []
+
+    def _schedule_loop(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while True:
+                    if not self._running:
+                        return
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        due, count, feed = heapq.heappop(self._heap)
+                        if feed.removed:
+                            continue
+                        break
+                    if self._heap:
+                        self._cond.wait(self._heap[0][0] - now)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._cond.release()
+            self._work.put(feed)
+
+    def _work_loop(self):
+        while True:
+            feed = self._work.get()
+            if feed == None:
+                return
+            feed.polls += 1
+            try:
+                statuses = list(feed.paginated.next_tweets())
+            except Exception, e:
+                feed.errors += 1
+                feed.interval = self.max_interval
+                if self.on_error != None:
+                    try:
+                        self.on_error(feed.key, e)
+                    except Exception:
+                        # A worker that died here would quietly shrink the pool
+                        _log.exception('on_error failed for feed %r', feed.key)
+            else:
+                if statuses:
+                    self.output.put((feed.key, statuses))
+                    feed.interval = max(self.min_interval, feed.interval * self.speedup)
+                else:
+                    feed.interval = min(self.max_interval, feed.interval * self.backoff)
+
+            self._cond.acquire()
+            try:
+                if not feed.removed:
+                    self._push(feed, time.time() + feed.interval)
+            finally:
+                self._cond.release()
+
+    def stats(self):
+        """Returns a dict with feed, poll and error counts
+        """
+        feeds = self._feeds.values()
+        return {'feeds': len(feeds),
+                'polls': sum([x.polls for x in feeds]),
+                'errors': sum([x.errors for x in feeds]),
+                'queued': self._work.qsize()}
@@ -0,0 +1,166 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+# Lower goes first
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+PRIORITY_POLL = 2
+
+
+class RateLimiter(object):
+    """Keeps track of one credential's API quota and holds requests back
+    instead of letting them fail once it's used up
+
+    The quota is a number of calls per window (an hour on Twitter). Seed it
+    from Twitter.rate_limit_status and it keeps itself current from the
+    X-RateLimit-* headers on every response. Requests that are waiting go
+    out in priority order, so a status update isn't stuck behind background
+    timeline polling
+    """
+
+    def __init__(self, limit=150, remaining=None, reset_time=None, window=3600):
+        """
+
+        Arguments:
+        - `limit`: Calls allowed per window
+        - `remaining`: Calls left in this window (defaults to limit)
+        - `reset_time`: Epoch seconds when the window resets (defaults to a window from now)
+        - `window`: Length of a window in seconds
+        """
+        self.limit = limit
+        if remaining == None:
+            remaining = limit
+        self.remaining = remaining
+        if reset_time == None:
+            reset_time = time.time() + window
+        self.reset_time = reset_time
+        self.window = window
+        self.in_flight = 0
+        self.waits = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def seed(self, status):
+        """Sets the quota from an account/rate_limit_status response
+        """
+        self._cond.acquire()
+        try:
+            self.limit = int(status['hourly_limit'])
+            self.remaining = int(status['remaining_hits'])
+            self.reset_time = float(status['reset_time_in_seconds'])
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def _update(self, headers):
+        # Called with the lock held. Returns True if the headers had a count
+        if headers == None:
+            return False
+        remaining = headers.getheader('X-RateLimit-Remaining')
+        if remaining == None:
+            return False
+        self.remaining = int(remaining)
+        limit = headers.getheader('X-RateLimit-Limit')
+        if limit != None:
+            self.limit = int(limit)
+        reset = headers.getheader('X-RateLimit-Reset')
+        if reset != None:
+            self.reset_time = float(reset)
+        return True
+
+    def _roll_window(self, now):
+        # Wait a second past the reset so our clock being a little ahead of
+        # Twitter's can't get us throttled
+        if now >= self.reset_time + 1:
+            self.remaining = self.limit
+            self.reset_time = self.reset_time + self.window
+            while self.reset_time + 1 <= now:
+                self.reset_time = self.reset_time + self.window
+
+    def acquire(self, priority=PRIORITY_READ, timeout=None):
+        """Waits for a call from the quota. Returns True once the request may be
+        sent, or False if timeout seconds went by first
+        Every successful acquire must be followed by a release
+
+        Arguments:
+        - `priority`: PRIORITY_WRITE, PRIORITY_READ or PRIORITY_POLL
+        - `timeout`: Most seconds to wait, None to wait as long as it takes
+        """
+        if timeout != None:
+            give_up = time.time() + timeout
+        self._cond.acquire()
+        try:
+            ticket = (priority, self._counter.next())
+            heapq.heappush(self._waiting, ticket)
+            waited = False
+            while True:
+                now = time.time()
+                self._roll_window(now)
+                if self._waiting[0] == ticket and self.remaining - self.in_flight > 0:
+                    heapq.heappop(self._waiting)
+                    self.in_flight += 1
+                    if waited:
+                        self.waits += 1
+                    # The next in line might be able to go too
+                    self._cond.notify_all()
+                    return True
+                if timeout != None and now >= give_up:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    return False
+                # With no quota left nothing changes until the reset, unless
+                # a response comes back with fresh headers
+                wait = None
+                if self.remaining - self.in_flight <= 0:
+                    wait = max(self.reset_time + 1 - now, 0.01)
+                if timeout != None:
+                    wait = min(wait or give_up - now, give_up - now)
+                waited = True
+                self._cond.wait(wait)
+        finally:
+            self._cond.release()
+
+    def release(self, headers=None):
+        """Marks an acquired call as finished
+
+        Arguments:
+        - `headers`: The response headers, if a response came back. Without
+                     X-RateLimit headers the call is counted against the quota locally
+        """
+        self._cond.acquire()
+        try:
+            self.in_flight -= 1
+            if not self._update(headers):
+                self.remaining = max(self.remaining - 1, 0)
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """Returns a dict with the quota as currently known
+        """
+        return {'limit': self.limit, 'remaining': self.remaining,
+                'reset_time': self.reset_time, 'in_flight': self.in_flight,
+                'queued': len(self._waiting), 'waits': self.waits}
@@ -0,0 +1,443 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import pickle
+import random
+import shutil
+import socket
+import tempfile
+import unittest
+import urllib2
+from StringIO import StringIO
+
+import batch
+import berd
+import cursors
+import fileutil
+import httpcache
+import jsonstream
+import oauth
+import transport
+from fakeserver import FakeTwitter
+from idset import IdSet
+
+
+class UserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTwitter()
+        berd.set_user_cache(berd.UserCache())
+
+    def tearDown(self):
+        berd.set_user_cache(berd.UserCache())
+
+    def test_methods(self):
+        user = berd.get_user(self.fake.user(1001))
+        self.assertEqual(str(user), '@user1001: User 1001')
+        for name in ('get_timeline', 'friendship_create', 'friendship_destroy',
+                     'block_create', 'block_destroy'):
+            self.assertTrue(hasattr(user, name), name)
+
+    def test_shared(self):
+        first = berd.get_user(self.fake.user(1001))
+        self.assertTrue(berd.get_user(self.fake.user(1001)) is first)
+
+    def test_viewer_fields_not_shared(self):
+        user_dict = self.fake.user(1001)
+        user_dict['following'] = True
+        user = berd.get_user(user_dict)
+        self.assertFalse('following' in user.user_dict)
+        self.assertEqual(user.user_dict['time_zone'], user_dict['time_zone'])
+        self.assertEqual(berd.User(user_dict).user_dict['following'], True)
+
+
+
+class PickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTwitter()
+
+    def test_status(self):
+        for protocol in (0, 2):
+            for lazy in (False, True):
+                status = berd.Status(self.fake.status(7), lazy)
+                copy = pickle.loads(pickle.dumps(status, protocol))
+                self.assertEqual(copy.status_dict, status.status_dict)
+                self.assertEqual(str(copy), str(status))
+
+    def test_user_keeps_extra(self):
+        user = berd.User(self.fake.user(1001))
+        copy = pickle.loads(pickle.dumps(user))
+        self.assertEqual(copy.user_dict, user.user_dict)
+        self.assertEqual(copy.user_dict['time_zone'], 'Eastern Time (US & Canada)')
+
+    def test_direct_message(self):
+        dm = berd.DirectMessage(self.fake.direct_message(3))
+        copy = pickle.loads(pickle.dumps(dm, 2))
+        self.assertEqual(copy.dm_dict, dm.dm_dict)
+
+
+class IterArrayTest(unittest.TestCase):
+
+    def value(self, rand, depth=0):
+        r = rand.random()
+        if depth > 3 or r < 0.3:
+            return rand.choice([1, -2.5e3, True, None, 12345678901, '',
+                                u'a"b\\c\xe9\n', 'x,]}{[', '\\'])
+        if r < 0.65:
+            return [self.value(rand, depth + 1) for x in range(rand.randint(0, 4))]
+        return dict(('k%d"' % x, self.value(rand, depth + 1))
+                    for x in range(rand.randint(0, 4)))
+
+    def test_matches_json_loads(self):
+        rand = random.Random(4)
+        for x in range(200):
+            text = json.dumps([self.value(rand) for y in range(rand.randint(0, 6))],
+                              indent=rand.choice([None, 1]))
+            expected = json.loads(text)
+            for chunk_size in (1, 2, 3, 7, 64, 8192):
+                self.assertEqual(list(jsonstream.iter_array(StringIO(text), chunk_size)),
+                                 expected)
+
+    def test_big_element(self):
+        text = json.dumps([{'text': 'a\\"b' * 50000, 'ids': range(20000)}, 'x', 1])
+        self.assertEqual(list(jsonstream.iter_array(StringIO(text), 100)),
+                         json.loads(text))
+
+    def test_malformed(self):
+        for text in ('[{"a":1', '[1 2]', '{}', '[{"a":}]', '["abc', '[1,', '[[1,2]}]'):
+            for chunk_size in (1, 3, 100):
+                self.assertRaises(ValueError, list,
+                                  jsonstream.iter_array(StringIO(text), chunk_size))
+
+
+class WriteAtomicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'file')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        fileutil.write_atomic(self.path, lambda fp: fp.write('one'))
+        fileutil.write_atomic(self.path, lambda fp: fp.write('two'), sync=True)
+        self.assertEqual(open(self.path).read(), 'two')
+        self.assertEqual(os.listdir(self.directory), ['file'])
+
+    def test_failed_write_leaves_nothing_behind(self):
+        fileutil.write_atomic(self.path, lambda fp: fp.write('one'))
+        def write(fp):
+            fp.write('half')
+            raise IOError('disk full')
+        self.assertRaises(IOError, fileutil.write_atomic, self.path, write)
+        self.assertEqual(open(self.path).read(), 'one')
+        self.assertEqual(os.listdir(self.directory), ['file'])
+
+    def test_disk_cache(self):
+        cache = httpcache.DiskCache(self.directory)
+        body = 'x' * 100000
+        cache.put('key', '"etag"', None, body)
+        self.assertEqual(cache.get('key'), ('"etag"', None, body))
+        self.assertRaises(UnicodeError, cache.put, 'bad', None, None, u'\xe9')
+        self.assertEqual(os.listdir(self.directory), ['key'])
+        self.assertEqual(httpcache.DiskCache(self.directory).get('key')[2], body)
+
+    def test_idset(self):
+        ids = IdSet([5, 3, 3, 1 << 40])
+        ids.save(self.path)
+        self.assertEqual(IdSet.load(self.path), ids)
+
+    def test_cursors(self):
+        store = cursors.FileCursorStore(self.path)
+        store.save('timeline', {'last_id': 12, 'page': 2})
+        store.flush()
+        self.assertEqual(cursors.FileCursorStore(self.path).load('timeline'),
+                         {'last_id': 12, 'page': 2})
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTwitter()
+        self.twitter = berd.Twitter(base_url=self.fake.start())
+
+    def tearDown(self):
+        self.twitter._transport.pool.close()
+        self.fake.stop()
+
+    def test_dropped_results_release_connections(self):
+        timeline = self.twitter.friends_timeline()
+        timeline.set_streaming()
+        for x in range(8):
+            timeline._last_id = None
+            timeline.next_tweets()
+        stats = self.twitter.pool_stats()
+        self.assertEqual(stats['open'], stats['idle'])
+        self.assertEqual(len(list(timeline.get_tweets())), 20)
+
+    def test_acquire_timeout(self):
+        pool = transport.ConnectionPool(max_per_host=1, acquire_timeout=0.05)
+        key = ('http', 'example.com')
+        pool.acquire(key)
+        self.assertRaises(socket.timeout, pool.acquire, key)
+
+
+
+class IterPagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTwitter(statuses=50)
+        self.twitter = berd.Twitter(base_url=self.fake.start())
+
+    def tearDown(self):
+        self.twitter._transport.pool.close()
+        self.fake.stop()
+
+    def test_stops_at_empty_page(self):
+        pages = list(self.twitter.friends_timeline().iter_pages())
+        self.assertEqual([len(x) for x in pages], [20, 20, 10])
+
+    def test_error_is_raised(self):
+        self.fake.fail_next(1, 503)
+        pages = self.twitter.friends_timeline().iter_pages()
+        self.assertRaises(urllib2.HTTPError, list, pages)
+
+
+
+class NonceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = oauth.NonceCache(window=10)
+
+    def test_replay(self):
+        self.assertFalse(self.cache.use('c', 't', 'n1', 5))
+        self.assertTrue(self.cache.use('c', 't', 'n1', 6))
+        self.assertFalse(self.cache.use('c', 'other', 'n1', 6))
+
+    def test_kept_for_two_windows(self):
+        self.cache.use('c', 't', 'n1', 9)
+        self.assertTrue(self.cache.use('c', 't', 'n1', 15))
+        self.assertTrue(self.cache.use('c', 't', 'n1', 29))
+
+    def test_expire(self):
+        self.cache.use('c', 't', 'n1', 5)
+        self.cache.use('c', 't', 'n2', 15)
+        self.cache.expire(35)
+        self.assertEqual(len(self.cache), 1)
+        self.cache.expire(100)
+        self.assertEqual(len(self.cache), 0)
+        self.assertFalse(self.cache.use('c', 't', 'n1', 100))
+
+    def test_clock_steps_back(self):
+        self.cache.use('c', 't', 'n1', 15)
+        self.cache.use('c', 't', 'n2', 25)
+        # Back across two bucket boundaries
+        self.assertTrue(self.cache.use('c', 't', 'n1', 5))
+        self.assertFalse(self.cache.use('c', 't', 'n3', 5))
+        self.assertTrue(self.cache.use('c', 't', 'n2', 26))
+        self.assertTrue(self.cache.use('c', 't', 'n3', 26))
+
+    def test_bloom(self):
+        cache = oauth.NonceCache(window=10, bloom_bits=1 << 10)
+        for i in range(200):
+            self.assertFalse(cache.use('c', 't', str(i), 5))
+        for i in range(200):
+            self.assertTrue(cache.use('c', 't', str(i), 12))
+
+
+
+class OAuthParsingTest(unittest.TestCase):
+
+    def split_header(self, header):
+        return oauth.OAuthRequest._split_header(header)
+
+    def split_query(self, query):
+        return oauth.OAuthRequest._split_url_string(query)
+
+    def test_header_quoted_commas(self):
+        self.assertEqual(self.split_header(
+            'realm="http://example.com/", oauth_nonce="a,b", oauth_token="c%2Cd"'),
+            {'oauth_nonce': 'a,b', 'oauth_token': 'c,d'})
+
+    def test_header_empty_and_bare_values(self):
+        self.assertEqual(self.split_header('oauth_token="", oauth_nonce=n1 ,x=""'),
+                         {'oauth_token': '', 'oauth_nonce': 'n1', 'x': ''})
+
+    def test_header_repeated_key(self):
+        self.assertEqual(self.split_header('a="1", a="2"'), {'a': '2'})
+
+    def test_header_percent_encoded(self):
+        self.assertEqual(self.split_header('oauth_signature="ab%2Bc%3D", x="a+b"'),
+                         {'oauth_signature': 'ab+c=', 'x': 'a+b'})
+
+    def test_header_malformed(self):
+        for header in ('a="1" b="2"', 'a="1', 'a'):
+            self.assertRaises(oauth.OAuthError, self.split_header, header)
+
+    def test_query_empty_values(self):
+        self.assertEqual(self.split_query('a=1&b=&c&d=4'), {'a': '1', 'd': '4'})
+
+    def test_query_repeated_key(self):
+        self.assertEqual(self.split_query('a=1&a=2;a=3'), {'a': '1'})
+
+    def test_query_percent_encoded(self):
+        self.assertEqual(self.split_query('k%20x=v%2Bw+z&y=%2541&z=a%3Db'),
+                         {'k x': 'v+w z', 'y': '%41', 'z': 'a=b'})
+
+    def test_from_request(self):
+        request = oauth.OAuthRequest.from_request('GET',
+            'http://example.com/x.json?count=20&since_id=5',
+            {'Authorization': 'OAuth realm="r", oauth_nonce="a%2Cb"'},
+            query_string='page=2&page=3')
+        self.assertEqual(request.parameters, {'count': '20', 'since_id': '5',
+                                              'page': '2', 'oauth_nonce': 'a,b'})
+
+
+class VerifyRequestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.consumer = oauth.OAuthConsumer('consumer', 'consumer secret')
+        self.token = oauth.OAuthToken('token', 'token secret')
+        store = oauth.MemoryOAuthDataStore()
+        store.add_consumer(self.consumer)
+        store.add_token(self.token)
+        self.server = oauth.OAuthServer(store)
+        self.server.add_signature_method(oauth.OAuthSignatureMethod_HMAC_SHA1())
+
+    def request(self, nonce, timestamp=None, sign=True):
+        request = oauth.OAuthRequest.from_consumer_and_token(self.consumer,
+            self.token, 'GET', 'http://example.com/statuses/home_timeline.json',
+            {'count': '20', 'oauth_nonce': nonce})
+        if timestamp != None:
+            request.set_parameter('oauth_timestamp', timestamp)
+        request.sign_request(oauth.OAuthSignatureMethod_HMAC_SHA1(),
+                             self.consumer, self.token)
+        if not sign:
+            request.set_parameter('oauth_signature', 'wrong')
+        return request
+
+    def test_bad_timestamp(self):
+        self.assertRaises(oauth.OAuthError, self.server._check_timestamp, 'abc')
+
+    def test_errors_stay_per_request(self):
+        results = self.server.verify_requests(
+            [self.request('n1'), self.request('n2', 'abc'),
+             self.request('n3', sign=False), self.request('n4'),
+             self.request('n4')], 1)
+        self.assertEqual(results[0][2], {'count': '20'})
+        self.assertTrue(isinstance(results[1], oauth.OAuthError))
+        self.assertTrue(isinstance(results[2], oauth.OAuthError))
+        self.assertEqual(results[3][2], {'count': '20'})
+        self.assertTrue('Nonce already used' in results[4].message)
+
+    def test_bad_requests_keep_their_nonces(self):
+        self.server.verify_requests([self.request('n1', 'abc'),
+                                     self.request('n2', sign=False)], 1)
+        self.server.verify_request(self.request('n1'))
+        self.server.verify_request(self.request('n2'))
+
+
+
+class _Recorder(object):
+    """Stands in for berd.Twitter, recording the write calls made on it
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def favorite_create(self, status_id):
+        self.calls.append(('favorite_create', status_id))
+        if status_id == 'bad':
+            raise ValueError(status_id)
+        return 'fav %s' % status_id
+
+    def favorite_destroy(self, status_id):
+        self.calls.append(('favorite_destroy', status_id))
+
+    def update_status(self, text):
+        self.calls.append(('update_status', text))
+
+
+class CoalesceTest(unittest.TestCase):
+
+    def coalesce(self, operations):
+        results, order = batch.BatchExecutor(None).coalesce(operations)
+        return [(x.state, x.merged_into) for x in results], order
+
+    def test_create_destroy(self):
+        states, order = self.coalesce([('favorite_create', 1), ('favorite_destroy', '1')])
+        self.assertEqual(order, [])
+        self.assertEqual(states, [(batch.COALESCED, None)] * 2)
+
+    def test_destroy_create(self):
+        states, order = self.coalesce([('favorite_destroy', 1), ('favorite_create', 1)])
+        self.assertEqual(order, [1])
+        self.assertEqual(states, [(batch.COALESCED, None), (None, None)])
+
+    def test_destroy_create_destroy(self):
+        states, order = self.coalesce([('favorite_destroy', 1), ('favorite_create', 1),
+                                       ('favorite_destroy', 1)])
+        self.assertEqual(order, [2])
+        self.assertEqual(states[:2], [(batch.COALESCED, None)] * 2)
+
+    def test_create_destroy_create(self):
+        states, order = self.coalesce([('favorite_create', 1), ('favorite_destroy', 1),
+                                       ('favorite_create', 1)])
+        self.assertEqual(order, [2])
+
+    def test_repeats(self):
+        states, order = self.coalesce([('favorite_create', 1), ('favorite_create', 1),
+                                       ('favorite_create', 2), ('favorite_create', 1)])
+        self.assertEqual(order, [0, 2])
+        self.assertEqual(states[1], (batch.COALESCED, 0))
+        self.assertEqual(states[3], (batch.COALESCED, 0))
+
+    def test_repeats_after_destroy_create(self):
+        states, order = self.coalesce([('favorite_destroy', 1), ('favorite_create', 1),
+                                       ('favorite_create', 1)])
+        self.assertEqual(order, [1])
+        self.assertEqual(states[2], (batch.COALESCED, 1))
+
+    def test_not_idempotent(self):
+        states, order = self.coalesce([('update_status', 'hi'), ('update_status', 'hi')])
+        self.assertEqual(order, [0, 1])
+
+    def test_run_shares_results(self):
+        twitter = _Recorder()
+        results = batch.BatchExecutor(twitter, retries=0).run(
+            [('favorite_create', 1), ('favorite_create', 1),
+             ('favorite_create', 'bad'), ('favorite_create', 'bad'),
+             ('favorite_destroy', 2), ('favorite_create', 2)])
+        self.assertEqual(sorted(twitter.calls), [('favorite_create', 1),
+                                                 ('favorite_create', 2),
+                                                 ('favorite_create', 'bad')])
+        self.assertEqual(results[1].value, 'fav 1')
+        self.assertEqual(results[1].merged_into, 0)
+        self.assertEqual(results[2].state, batch.FAILED)
+        self.assertTrue(results[3].error is results[2].error)
+        self.assertFalse(results[3].ok)
+        self.assertEqual(results[4].state, batch.COALESCED)
+        self.assertEqual(results[5].value, 'fav 2')
+
+
+if __name__ == '__main__':
+    unittest.main()
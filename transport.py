@@ -0,0 +1,572 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import base64
+import hashlib
+import httplib
+import json
+import re
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from StringIO import StringIO
+
+import jsonstream
+import oauth
+from instrument import clock
+from ratelimit import PRIORITY_READ
+
+
+# A path segment that's all digits, ie the id in statuses/show/1234
+_id_segment = re.compile(r'/\d+(?=/|$)')
+
+# Shared so every Transport signing for the same consumer and token reuses
+# one signing context
+_hmac_sha1 = oauth.OAuthSignatureMethod_HMAC_SHA1()
+
+
+class ConnectionPool(object):
+    """Keeps HTTP/1.1 keep-alive connections around so that requests to the
+    same host reuse an open socket instead of reconnecting every time
+
+    hits and misses count how many requests got an idle connection versus
+    how many had to open a new one
+    """
+
+    def __init__(self, max_per_host=4, idle_timeout=30, timeout=None,
+                 acquire_timeout=60):
+        """
+
+        Arguments:
+        - `max_per_host`: Most connections (idle and in use) to keep open per host
+        - `idle_timeout`: Seconds an idle connection is kept before it's thrown away
+        - `timeout`: Socket timeout in seconds (None for the global default)
+        - `acquire_timeout`: Seconds to wait for a free connection before giving
+                             up with socket.timeout (None to wait as long as it takes)
+        """
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.hits = 0
+        self.misses = 0
+        self._idle = {}
+        self._open = {}
+        self._cond = threading.Condition()
+
+    def _new_connection(self, scheme, netloc):
+        if scheme == 'https':
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        if self.timeout is None:
+            return conn_class(netloc)
+        return conn_class(netloc, timeout=self.timeout)
+
+    def acquire(self, key):
+        """Returns a (connection, reused) tuple for key, which is a
+        (scheme, netloc) tuple. Blocks while the host is at max_per_host, for
+        up to acquire_timeout seconds
+        """
+        give_up = None
+        if self.acquire_timeout is not None:
+            give_up = time.time() + self.acquire_timeout
+        self._cond.acquire()
+        try:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    # Oldest connections are at the front, drop the stale ones
+                    now = time.time()
+                    while idle and now - idle[0][1] > self.idle_timeout:
+                        idle.pop(0)[0].close()
+                        self._open[key] -= 1
+                    if idle:
+                        self.hits += 1
+                        return idle.pop()[0], True
+                if self._open.get(key, 0) < self.max_per_host:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    self.misses += 1
+                    break
+                if give_up is None:
+                    self._cond.wait()
+                    continue
+                remaining = give_up - time.time()
+                if remaining <= 0:
+                    raise socket.timeout('Timed out waiting for a connection to %s' % key[1])
+                self._cond.wait(remaining)
+        finally:
+            self._cond.release()
+        return self._new_connection(*key), False
+
+    def release(self, key, conn):
+        """Hands a connection whose response has been fully read back to the pool
+        """
+        self._cond.acquire()
+        try:
+            self._idle.setdefault(key, []).append((conn, time.time()))
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def discard(self, key, conn):
+        """Closes a connection that can't be reused
+        """
+        conn.close()
+        self._cond.acquire()
+        try:
+            self._open[key] -= 1
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def close(self):
+        """Closes every idle connection
+        """
+        self._cond.acquire()
+        try:
+            for key, idle in self._idle.items():
+                for conn, last_used in idle:
+                    conn.close()
+                self._open[key] -= len(idle)
+            self._idle = {}
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """Returns a dict with the hit/miss counters and connection counts
+        """
+        self._cond.acquire()
+        try:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'open': sum(self._open.values()),
+                    'idle': sum([len(x) for x in self._idle.values()])}
+        finally:
+            self._cond.release()
+
+    def request(self, method, url, body=None, headers=None, timing=None, sign=None):
+        """Sends a request over a pooled connection and returns a PooledResponse
+
+        A reused connection the server has already closed gets one retry on a
+        fresh connection
+
+        Arguments:
+        - `method`: HTTP method, ie GET
+        - `url`: Absolute URL
+        - `body`: Request body or None
+        - `headers`: Dict of extra headers
+        - `timing`: instrument.RequestTiming to fill in, or None
+        - `sign`: Called before every attempt, retries included, for a dict
+                  of headers to add to it, ie a freshly signed OAuth
+                  Authorization header
+        """
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+
+        while True:
+            conn, reused = self.acquire(key)
+            try:
+                if timing is not None:
+                    timing.reused = reused
+                    if conn.sock is None:
+                        start = clock()
+                        conn.connect()
+                        timing.connect = clock() - start
+                    start = clock()
+                attempt_headers = headers or {}
+                if sign is not None:
+                    attempt_headers = dict(attempt_headers)
+                    attempt_headers.update(sign())
+                conn.request(method, path, body, attempt_headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                self.discard(key, conn)
+                if reused:
+                    continue
+                raise
+            if timing is not None:
+                timing.ttfb = clock() - start
+                timing.status = response.status
+            return PooledResponse(self, key, conn, response, url, timing)
+
+
+class PooledResponse(object):
+    """File-like response that gives its connection back to the pool once the
+    body has been read all the way through
+    """
+
+    def __init__(self, pool, key, conn, response, url, timing=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._url = url
+        self._timing = timing
+
+    def _done(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.will_close:
+            self._pool.discard(self._key, conn)
+        else:
+            self._pool.release(self._key, conn)
+
+    def __del__(self):
+        # A response dropped unread, ie a streamed next_tweets result nobody
+        # iterated, would otherwise keep its place in the pool for good
+        self.close()
+
+    def read(self, amt=None):
+        if self._conn is None and self._response.isclosed():
+            return ''
+        timing = self._timing
+        if timing is not None:
+            start = clock()
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if timing is not None:
+            timing.download += clock() - start
+            timing.bytes_in += len(data)
+        if self._response.isclosed():
+            self._done()
+        return data
+
+    def close(self):
+        """Closes the response. If the body wasn't finished the connection
+        can't be reused, so it gets dropped
+        """
+        if self._conn is None:
+            return
+        if self._response.isclosed():
+            self._done()
+        else:
+            conn, self._conn = self._conn, None
+            self._response.close()
+            self._pool.discard(self._key, conn)
+
+    def getcode(self):
+        return self._response.status
+
+    def geturl(self):
+        return self._url
+
+    def info(self):
+        return self._response.msg
+
+    def to_error(self):
+        """Reads the rest of the body and returns it wrapped in a urllib2.HTTPError
+        """
+        body = self.read()
+        return urllib2.HTTPError(self._url, self._response.status,
+                                 self._response.reason, self._response.msg,
+                                 StringIO(body))
+
+
+class CachedResponse(StringIO):
+    """File-like response for a body that's already in memory
+    """
+
+    def __init__(self, url, code, headers, body):
+        StringIO.__init__(self, body)
+        self._url = url
+        self._code = code
+        self._headers = headers
+
+    def getcode(self):
+        return self._code
+
+    def geturl(self):
+        return self._url
+
+    def info(self):
+        return self._headers
+
+
+class Transport(object):
+    """Sends requests for a Twitter object and every Paginated it hands out
+
+    Everything goes through a shared ConnectionPool so connections are kept
+    alive between calls
+    """
+
+    def __init__(self, base_url, pool=None):
+        """
+
+        Arguments:
+        - `base_url`: Root of the API, ie http://twitter.com/
+        - `pool`: ConnectionPool to use. A new one is made if None
+        """
+        self.base_url = base_url
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+        self.cache = None
+        self.limiter = None
+        self.instrumentation = None
+        self.verified = None
+        self._headers = {}
+        self._oauth = None
+        # Who the requests are made as, so cached responses aren't shared
+        # between accounts
+        self._identity = ''
+
+    def set_basic_auth(self, uname, pword):
+        """Sends HTTP basic authentication with every request
+        """
+        token = base64.b64encode('%s:%s' % (uname, pword))
+        self._headers['Authorization'] = 'Basic ' + token
+        self._oauth = None
+        self._identity = uname
+
+    def set_oauth(self, consumer, token):
+        """Signs every request with OAuth HMAC-SHA1, in an Authorization header
+
+        Arguments:
+        - `consumer`: oauth.OAuthConsumer for the application
+        - `token`: oauth.OAuthToken (access token) for the account
+        """
+        self._headers.pop('Authorization', None)
+        self._oauth = _hmac_sha1.get_context(consumer, token)
+        self._identity = token.key
+
+    def clear_auth(self):
+        """Goes back to sending unauthenticated requests
+        """
+        self._headers.pop('Authorization', None)
+        self._oauth = None
+        self._identity = ''
+
+    def _oauth_header(self, method, url, data):
+        context = self._oauth
+        url, x, query = url.partition('?')
+        parameters = dict(urlparse.parse_qsl(query))
+        if data:
+            parameters.update(urlparse.parse_qsl(data))
+        request = oauth.OAuthRequest.from_consumer_and_token(
+            context.consumer, context.token, method, url, parameters)
+        request.set_parameter('oauth_signature_method', _hmac_sha1.get_name())
+        request.set_parameter('oauth_signature', context.build_signature(request))
+        return request.to_header()['Authorization']
+
+    def set_cache(self, cache):
+        """Sets the httpcache.ResponseCache used for cacheable requests (None for no caching)
+        """
+        self.cache = cache
+
+    def set_limiter(self, limiter):
+        """Sets the ratelimit.RateLimiter requests wait on (None for no limiting)
+        """
+        self.limiter = limiter
+
+    def set_verified(self, verified):
+        """Sets the verified.VerifiedTokens to tell when a request's OAuth
+        token is turned down with a 401, so it's checked again next time
+        """
+        self.verified = verified
+
+    def _error(self, response):
+        # Reads a 4xx/5xx response into the urllib2.HTTPError to raise
+        if response.getcode() == 401 and self.verified is not None and self._oauth is not None:
+            self.verified.forget(self._identity)
+        return response.to_error()
+
+    def set_instrumentation(self, instrumentation):
+        """Sets the instrument.Instrumentation requests are recorded in (None to stop)
+        """
+        self.instrumentation = instrumentation
+
+    def endpoint(self, url):
+        """Name requests for url are recorded under: the API method with ids
+        replaced, ie statuses/show/:id
+        """
+        if url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        url = url.split('?', 1)[0]
+        if url.endswith('.json'):
+            url = url[:-len('.json')]
+        return _id_segment.sub('/:id', '/' + url.lstrip('/'))[1:]
+
+    def _signer(self, method, url, data):
+        # OAuth headers carry a timestamp and nonce, so they're made as each
+        # attempt goes out, not before waiting on the rate limiter
+        if self._oauth is None:
+            return None
+        return lambda: {'Authorization': self._oauth_header(method, url, data)}
+
+    def _send(self, method, url, data, headers, priority, timing=None):
+        limiter = self.limiter
+        sign = self._signer(method, url, data)
+        if limiter is None or priority is None:
+            return self.pool.request(method, url, data, headers, timing, sign)
+        limiter.acquire(priority)
+        try:
+            response = self.pool.request(method, url, data, headers, timing, sign)
+        except:
+            limiter.release()
+            raise
+        limiter.release(response.info())
+        return response
+
+    def request_headers(self, method, url, data=None):
+        """Returns a new dict of the headers (authentication and so on) to send
+        with a request for url. With OAuth it's signed now, so send it right away
+        """
+        headers = dict(self._headers)
+        if self._oauth is not None:
+            headers['Authorization'] = self._oauth_header(method, url, data)
+        return headers
+
+    def open(self, url, data=None, cacheable=False, priority=PRIORITY_READ):
+        """Opens url and returns a file-like response
+
+        Raises urllib2.HTTPError for 4xx/5xx responses, like urllib2 openers do
+
+        Arguments:
+        - `url`: Absolute URL
+        - `data`: Urlencoded POST body. If None, a GET is sent
+        - `cacheable`: If True and there's a cache, the GET is made conditional
+                       on what's cached and a 304 is answered from the cache
+        - `priority`: Where the request goes in the rate limiter's queue. None
+                      skips the limiter, for calls that don't count against the quota
+        """
+        instr = self.instrumentation
+        if instr is None:
+            return self._open(url, data, cacheable, priority)
+        timing = self._begin(instr, url, data)
+        try:
+            response = self._open(url, data, cacheable, priority, timing)
+        except Exception, e:
+            instr.end(timing, e)
+            raise
+        instr.end(timing)
+        return response
+
+    def get_json(self, url, data=None, cacheable=False, priority=PRIORITY_READ, stream=False):
+        """Opens url and returns the decoded JSON body. Takes the same
+        arguments as open, plus:
+
+        - `stream`: Return a jsonstream.iter_array generator over the body
+                    (which must be a JSON array) instead of decoding it all at once
+        """
+        instr = self.instrumentation
+        if instr is None:
+            response = self._open(url, data, cacheable, priority)
+            if stream:
+                return jsonstream.iter_array(response)
+            return json.load(response)
+
+        timing = self._begin(instr, url, data)
+        try:
+            response = self._open(url, data, cacheable, priority, timing)
+            if stream:
+                return self._timed_stream(instr, timing, response)
+            body = response.read()
+            start = clock()
+            result = json.loads(body)
+            timing.decode = clock() - start
+        except Exception, e:
+            instr.end(timing, e)
+            raise
+        instr.end(timing)
+        return result
+
+    def _begin(self, instr, url, data):
+        if data is None:
+            method = 'GET'
+        else:
+            method = 'POST'
+        return instr.begin(self.endpoint(url), method, url, len(data or ''))
+
+    def _timed_stream(self, instr, timing, response):
+        # Download and decode are interleaved, so they're measured together
+        # as decode. The request is recorded once the array is finished
+        items = jsonstream.iter_array(response)
+        error = None
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = items.next()
+                except StopIteration:
+                    timing.decode += clock() - start
+                    break
+                timing.decode += clock() - start
+                yield item
+        except Exception, e:
+            error = e
+            raise
+        finally:
+            timing.download = 0.0
+            instr.end(timing, error)
+
+    def _open(self, url, data=None, cacheable=False, priority=PRIORITY_READ, timing=None):
+        headers = dict(self._headers)
+        if data is None:
+            method = 'GET'
+        else:
+            method = 'POST'
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        cache = self.cache
+        if cache is None or not cacheable or data is not None:
+            response = self._send(method, url, data, headers, priority, timing)
+            if response.getcode() >= 400:
+                raise self._error(response)
+            return response
+
+        key = hashlib.sha1(self._identity + '\n' + url).hexdigest()
+        entry = cache.get(key)
+        if entry is not None:
+            etag, last_modified, body = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = self._send(method, url, data, headers, priority, timing)
+        code = response.getcode()
+        if code == 304 and entry is not None:
+            response.read()
+            cache.record_hit(len(body))
+            if timing is not None:
+                timing.cached = True
+            return CachedResponse(url, 200, response.info(), body)
+        if code >= 400:
+            raise self._error(response)
+
+        cache.record_miss()
+        info = response.info()
+        etag = info.getheader('ETag')
+        last_modified = info.getheader('Last-Modified')
+        if not etag and not last_modified:
+            if entry is not None:
+                cache.delete(key)
+            return response
+        body = response.read()
+        cache.put(key, etag, last_modified, body)
+        return CachedResponse(url, code, info, body)
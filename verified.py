@@ -0,0 +1,91 @@
+"""
+    Berd - A Twitter library for Python
+    Copyright (C) 2009 Christian Blades
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+
+
+class VerifiedTokens(object):
+    """Remembers which OAuth tokens account/verify_credentials accepted, and
+    whose they are, so a Twitter object for a recently verified token can
+    skip the verify call
+
+    Kept in memory, and in a cursors.CursorStore if one is given so it
+    lasts across restarts. Entries are keyed 'verified:<token key>', so the
+    store can be the one Paginated cursors are kept in
+    """
+
+    def __init__(self, store=None, ttl=86400):
+        """
+
+        Arguments:
+        - `store`: cursors.FileCursorStore, cursors.SQLiteCursorStore, or None
+        - `ttl`: Seconds a verification is trusted for
+        """
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, token_key):
+        """Returns the screen name token_key was verified as, or None if it
+        hasn't been verified within ttl seconds
+        """
+        key = 'verified:' + token_key
+        entry = self._tokens.get(key)
+        if entry == None and self.store != None:
+            entry = self.store.load(key)
+            if entry != None:
+                self._tokens[key] = entry
+        if entry == None or time.time() - entry.get('verified_at', 0) > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['screen_name']
+
+    def remember(self, token_key, screen_name):
+        """Records that token_key was just verified as screen_name
+        """
+        key = 'verified:' + token_key
+        entry = {'verified_at': time.time(), 'screen_name': screen_name}
+        self._lock.acquire()
+        try:
+            self._tokens[key] = entry
+        finally:
+            self._lock.release()
+        if self.store != None:
+            self.store.save(key, entry)
+
+    def forget(self, token_key):
+        """Drops token_key, ie after Twitter turned it down with a 401
+        """
+        key = 'verified:' + token_key
+        entry = {'verified_at': 0, 'screen_name': None}
+        self._lock.acquire()
+        try:
+            self._tokens[key] = entry
+        finally:
+            self._lock.release()
+        if self.store != None:
+            self.store.save(key, entry)
+
+    def flush(self):
+        if self.store != None:
+            self.store.flush()